@@ -0,0 +1,191 @@
+from tet_mesh import TetMesh, tet_mesh_cuboid
+from material import LinearElastic, NeoHookean
+from fem import StaticFEM
+from linear_solver import PRECONDITIONERS, ConjugateGradient
+from main import boundary_conditions, cube_size, E, nu
+
+from scipy.sparse.linalg import splu
+from typing import List, Tuple
+
+import time
+import argparse
+import numpy as np
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int, int]]:
+    '''
+    Parse a comma-separated list of cuboid sizes, e.g., '4x2x2,20x8x8'.
+    '''
+    return [tuple(int(c) for c in size.split('x')) for size in sizes.split(',')]
+
+
+def benchmark_preconditioners(sizes: List[Tuple[int, int, int]], E: float, nu: float,
+                              max_iters: int=5000):
+    '''
+    Report CG iteration counts and timings with and without each preconditioner on the
+    linear elastic cuboid test problems. CG stops after `max_iters` iterations.
+    '''
+    material = LinearElastic(E, nu)
+    force = np.array([0, 0, -50])
+
+    print(f'{"size":>10} {"preconditioner":>14} {"iters":>6} {"setup (s)":>10} {"solve (s)":>10} '
+          f'{"residual":>10} {"status":>6}')
+
+    for nx, ny, nz in sizes:
+        # Assemble the reduced stiffness matrix of the test problem
+        mesh = tet_mesh_cuboid(nx, ny, nz, cube_size)
+        f_ext, bc = boundary_conditions(mesh.vertices, force, tolerance=cube_size * 0.5)
+        fem = StaticFEM(mesh, material)
+
+        K = fem.stiffness_matrix(mesh.vertices, bc)
+        f = f_ext.ravel()[(~bc).repeat(3)]
+
+        for preconditioner in [None, *PRECONDITIONERS]:
+            solver = ConjugateGradient(max_iters=max_iters, preconditioner=preconditioner)
+
+            # Time the preconditioner setup separately from the CG iterations. The solver reuses
+            # the preconditioner since K does not change.
+            start_time = time.perf_counter()
+            solver.preconditioner(K)
+            setup_time = time.perf_counter() - start_time
+
+            _, stats = solver.solve(K, f)
+
+            print(f'{f"{nx}x{ny}x{nz}":>10} {str(preconditioner):>14} {stats["iterations"]:>6} '
+                  f'{setup_time:>10.4f} {stats["time"]:>10.4f} '
+                  f'{stats["residual"]:>10.2e} {stats["status"]:>6}')
+
+
+def benchmark_parallel(sizes: List[Tuple[int, int, int]], E: float, nu: float,
+                       workers: List[int], repeats: int=3):
+    '''
+    Report the time of one fused evaluation of strain energy, elastic forces and the full
+    stiffness matrix of the Neo-Hookean material on cuboid meshes, using serial evaluation
+    (1 worker) and parallel evaluation with each number of worker processes. The best time of
+    `repeats` runs is reported.
+    '''
+    material = NeoHookean(E, nu)
+
+    print(f'{"size":>10} {"#tets":>8} {"workers":>7} {"time (s)":>9} {"speedup":>7}')
+
+    for nx, ny, nz in sizes:
+        mesh = tet_mesh_cuboid(nx, ny, nz, cube_size)
+
+        # Evaluate at a randomly perturbed configuration
+        rng = np.random.default_rng(0)
+        vertices = mesh.vertices + rng.uniform(-0.01, 0.01, mesh.vertices.shape) * cube_size
+
+        serial_time = None
+        for num_workers in workers:
+            fem = StaticFEM(mesh, material, num_workers=num_workers)
+
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                fem.evaluate(vertices, hessian=True)
+                times.append(time.perf_counter() - start_time)
+            fem.close()
+
+            best_time = min(times)
+            serial_time = best_time if serial_time is None else serial_time
+            print(f'{f"{nx}x{ny}x{nz}":>10} {mesh.elements.shape[0]:>8} {num_workers:>7} '
+                  f'{best_time:>9.4f} {serial_time / best_time:>7.2f}')
+
+
+def shuffle_mesh(mesh: TetMesh, seed: int=0) -> TetMesh:
+    '''
+    Randomly permute the vertices and elements of a tet mesh, which mimics meshes generated in an
+    arbitrary order.
+    '''
+    rng = np.random.default_rng(seed)
+    vertex_order = rng.permutation(mesh.vertices.shape[0])
+    new_index = np.argsort(vertex_order)
+    elements = new_index[mesh.elements][rng.permutation(mesh.elements.shape[0])]
+    return TetMesh(mesh.vertices[vertex_order], elements)
+
+
+def benchmark_reordering(sizes: List[Tuple[int, int, int]], E: float, nu: float,
+                         repeats: int=3):
+    '''
+    Report the effect of mesh reordering on the bandwidth of the reduced stiffness matrix, the
+    assembly time (one fused Neo-Hookean evaluation of forces and stiffness), the CG solve of the
+    linear elastic problem, and the fill-in of sparse LU factorization. Fill-in is the number of
+    nonzeros in L and U relative to K, using the mesh ordering as is ('natural') and using the
+    minimum degree ordering of the direct solver ('mmd').
+
+    Cuboid meshes are randomly shuffled first to mimic arbitrarily ordered input meshes.
+    '''
+    linear_material, neohookean_material = LinearElastic(E, nu), NeoHookean(E, nu)
+    force = np.array([0, 0, -50])
+
+    print(f'{"size":>10} {"order":>8} {"bandwidth":>9} {"assembly (s)":>12} {"CG iters":>8} '
+          f'{"CG (s)":>8} {"fill natural":>12} {"fill mmd":>8}')
+
+    for nx, ny, nz in sizes:
+        shuffled = shuffle_mesh(tet_mesh_cuboid(nx, ny, nz, cube_size))
+        meshes = {'shuffled': shuffled}
+        for method in ('rcm', 'morton'):
+            meshes[method] = shuffled.reorder(method)[0]
+
+        for order, mesh in meshes.items():
+            f_ext, bc = boundary_conditions(mesh.vertices, force, tolerance=cube_size * 0.5)
+
+            # Time the fused assembly of forces and the full stiffness matrix
+            fem = StaticFEM(mesh, neohookean_material)
+            assembly_time = np.inf
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                fem.evaluate(mesh.vertices, hessian=True)
+                assembly_time = min(assembly_time, time.perf_counter() - start_time)
+
+            # Solve the linear elastic problem with CG
+            fem = StaticFEM(mesh, linear_material)
+            _, stats = fem.solve_linear(f_ext, bc, return_stats=True)
+
+            # Measure the bandwidth and the fill-in of the reduced stiffness matrix
+            K = fem.stiffness_matrix(mesh.vertices, bc).tocoo()
+            bandwidth = np.abs(K.row - K.col).max()
+            fills = []
+            for permc_spec in ('NATURAL', 'MMD_AT_PLUS_A'):
+                factor = splu(K.tocsc(), permc_spec=permc_spec)
+                fills.append((factor.L.nnz + factor.U.nnz) / K.nnz)
+
+            print(f'{f"{nx}x{ny}x{nz}":>10} {order:>8} {bandwidth:>9} {assembly_time:>12.4f} '
+                  f'{stats[0]["iterations"]:>8} {stats[0]["time"]:>8.4f} {fills[0]:>12.2f} '
+                  f'{fills[1]:>8.2f}')
+
+
+def main():
+    '''
+    Main routine.
+    '''
+    # Command line argument parser
+    parser = argparse.ArgumentParser(description='FEM performance benchmarks')
+    parser.add_argument('benchmark', choices=['preconditioners', 'parallel', 'reordering'],
+                        help='The benchmark to run')
+    parser.add_argument('-c', '--cuboid-sizes', default='',
+                        help='Comma-separated cuboid sizes (e.g. 4x2x2,20x8x8). Defaults to '
+                             '4x2x2,10x4x4,20x8x8 for preconditioners, 20x8x8,40x16x16 for '
+                             'parallel and 10x4x4,20x8x8 for reordering')
+    parser.add_argument('-w', '--workers', default='1,2,4,8',
+                        help='Comma-separated numbers of worker processes for the parallel '
+                             'benchmark (e.g. 1,2,4,8)')
+    parser.add_argument('--nu', type=float, default=nu, help="Poisson's ratio")
+
+    # Process arguments
+    args = parser.parse_args()
+    workers = [int(w) for w in args.workers.split(',')]
+
+    if args.benchmark == 'preconditioners':
+        sizes = parse_sizes(args.cuboid_sizes or '4x2x2,10x4x4,20x8x8')
+        benchmark_preconditioners(sizes, E, args.nu)
+    elif args.benchmark == 'parallel':
+        sizes = parse_sizes(args.cuboid_sizes or '20x8x8,40x16x16')
+        benchmark_parallel(sizes, E, args.nu, workers)
+    elif args.benchmark == 'reordering':
+        sizes = parse_sizes(args.cuboid_sizes or '10x4x4,20x8x8')
+        benchmark_reordering(sizes, E, args.nu)
+
+
+if __name__ == '__main__':
+    main()
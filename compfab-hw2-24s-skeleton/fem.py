@@ -1,25 +1,267 @@
 from tet_mesh import TetMesh
-from material import Material
+from material import Material, von_mises_stress, green_lagrange_strain, equivalent_strain
+from mesh_quality import DEGENERATE_TOLERANCE, normalized_volumes_from_bases
+from linear_solver import LinearSolver, ConjugateGradient, make_solver
+from instrumentation import Instrumentation, timed
+from parallel import SharedArrays, WorkerPool, chunk_ranges
 
 from numpy import ndarray as array
 from scipy.sparse import csc_matrix, spmatrix
-from scipy.sparse.linalg import cg
-from functools import partial
-from typing import Type, List
+from scipy.sparse.linalg import LinearOperator
+from typing import Type, List, Tuple, Dict, Union
 
+import os
+import hashlib
+import weakref
 import numpy as np
 
-# CG solver
-conjugate_gradient = partial(cg, tol=1e-5)
+
+# Default number of elements per chunk when assembling stiffness matrices in compact mode
+COMPACT_CHUNK_SIZE = 2 ** 12
+
+
+def boundary_key(boundary_conditions: array) -> bytes:
+    '''
+    Convert a boundary condition mask into a hashable key for caching.
+    '''
+    return np.asarray(boundary_conditions, dtype=bool).tobytes()
+
+
+def deformation_gradient_kernel(vertices: array, elements: array, Dm_inv: array) -> array:
+    '''
+    Compute the (Txdxd) deformation gradients of tet elements (`elements`) at vertex positions
+    `vertices`, given the inverses of their rest bases (`Dm_inv`).
+    '''
+    # Formula: F = Ds * Dm^(-1), where Ds = [x2 - x1, x3 - x1, x4 - x1]
+    tet_vertices = vertices[elements]
+    Ds = (tet_vertices[:, 1:] - tet_vertices[:, [0]]).transpose(0, 2, 1)
+    return Ds @ Dm_inv
+
+
+def gradient_kernel(P: array, volumes: array, Dm_inv: array, dF_dx: array=None) -> array:
+    '''
+    Compute the (Tx12) gradients of the element strain energies w.r.t. their vertex positions from
+    (Txdxd) stress tensors, i.e., `volume * P : dF/dx`. If `dF_dx` is None, its structure is
+    derived from `Dm_inv` on the fly.
+    '''
+    # Compute dE/dx = volume * P * dF/dx for all tet elements
+    if dF_dx is not None:
+        P_vec = P.transpose(0, 2, 1).reshape(P.shape[0], -1)
+        return np.einsum('ti,tij->tj', P_vec, dF_dx) * volumes[:, None]
+
+    # Without dF/dx, use its structure instead. The gradient w.r.t. vertices 2 to 4 is given by
+    # the columns of H = volume * P * Dm^(-T), and that w.r.t. vertex 1 is their negated sum
+    H = (P @ Dm_inv.transpose(0, 2, 1)) * volumes[:, None, None]
+    dE_dx = np.concatenate((-H.sum(axis=2)[:, None], H.transpose(0, 2, 1)), axis=1)
+    return dE_dx.reshape(P.shape[0], -1)
+
+
+def hessian_kernel(dP_dF: array, volumes: array, Dm_inv: array, dF_dx: array=None) -> array:
+    '''
+    Compute the (Tx12x12) element stiffness matrices from (Txd^2xd^2) stress differentials. If
+    `dF_dx` is None, its structure is derived from `Dm_inv` on the fly.
+    '''
+    # Compute the contributions of all tet elements to K at once
+    # Formula: Kt = d^2(Et)/d(xt)^2 = volume * (dP/dF * dF/dx)^T * dF/dx
+    # (d^2F/dx^2 is zero since F is linear in x)
+    if dF_dx is not None:
+        dP_dx = dP_dF @ dF_dx
+        Kt = dP_dx.transpose(0, 2, 1) @ dF_dx
+
+    # Without dF/dx, use its structure instead. dF[i, a]/dx[b, j] = delta(i, j) * G[b, a], where
+    # the rows of G are the gradients of the linear shape functions (the rows of Dm^(-1) for
+    # vertices 2 to 4 and their negated sum for vertex 1), so
+    #   Kt[(b, i), (e, k)] = sum(G[b, a] * dP/dF[(a, i), (c, k)] * G[e, c])
+    # where the indices of dP/dF follow the column-major order of F. The two contractions with
+    # G are carried out as batched matrix products.
+    else:
+        num_F, dim = Dm_inv.shape[:2]
+        G = np.concatenate((-Dm_inv.sum(axis=1, keepdims=True), Dm_inv), axis=1)
+        num_nodes = G.shape[1]
+
+        # Contract over c, giving B[(a, i, k), e]
+        B = dP_dF.reshape(num_F, dim * dim, dim, dim).transpose(0, 1, 3, 2)
+        B = B.reshape(num_F, -1, dim) @ G.transpose(0, 2, 1)
+
+        # Contract over a, giving Kt[b, (i, k, e)], and reorder the axes into (b, i, e, k)
+        Kt = G @ B.reshape(num_F, dim, -1)
+        Kt = Kt.reshape(num_F, num_nodes, dim, dim, num_nodes).transpose(0, 1, 2, 4, 3)
+        Kt = Kt.reshape(num_F, num_nodes * dim, -1)
+
+    Kt = Kt * volumes[:, None, None]
+
+    # Suppress negative zeroes
+    Kt[np.abs(Kt) < 1e-8] = 0
+    return Kt
+
+
+def scatter_kernel(pairs: array, elements: array, block_indptr: array, dim: int) -> array:
+    '''
+    Compute the (Tx(md)^2) slots of the entries of element stiffness matrices in the CSC data
+    array of the stiffness matrix, where m is the simplex size. The pattern of K consists of dxd
+    blocks of vertex pairs, whose column pointers are `block_indptr`, and `pairs` (Txm^2) holds
+    the block index of every (row, column) vertex pair of every element.
+    '''
+    num_elements, m = elements.shape
+    index_type = block_indptr.dtype
+    components = np.arange(dim, dtype=index_type)
+
+    # The entry (p, q) of the block with index k in vertex column j lies at
+    #   d * k + d * (d - 1) * block_indptr[j] + d * #blocks(j) * q + p
+    # since every DOF column of vertex j holds d entries per block
+    col_base = (dim * (dim - 1)) * block_indptr[elements]
+    col_stride = dim * (block_indptr[elements + 1] - block_indptr[elements])
+    base = dim * pairs.reshape(num_elements, m, m) + col_base[:, None, :]
+
+    slots = np.empty((num_elements, m, dim, m, dim), dtype=index_type)
+    np.add(base[:, :, None, :, None], (col_stride[:, :, None] * components)[:, None, None],
+           out=slots)
+    slots += components[:, None, None]
+    return slots.reshape(num_elements, -1)
+
+
+def evaluate_chunk(arrays: Dict[str, array], start: int, end: int, material: Material,
+                   hessian: bool):
+    '''
+    Evaluate the tet elements in the range [start, end) inside a worker process. The inputs are
+    read from and the outputs are written into the shared arrays (`arrays`):
+        * inputs: `vertices`, `elements`, `Dm_inv`, `volumes` and optionally `dF_dx`
+        * outputs: element energies `E`, energy gradients `dE_dx` and, if `hessian` is True,
+            element stiffness matrices `Kt`
+    '''
+    # Slice the per-element inputs of the chunk
+    elements = arrays['elements'][start:end]
+    Dm_inv = arrays['Dm_inv'][start:end]
+    volumes = arrays['volumes'][start:end]
+    dF_dx = arrays['dF_dx'][start:end] if 'dF_dx' in arrays else None
+
+    # Evaluate the material model and write the results of the chunk
+    F = deformation_gradient_kernel(arrays['vertices'], elements, Dm_inv)
+    W, P, dP_dF = material.evaluate_batch(F, differential=hessian)
+
+    arrays['E'][start:end] = W * volumes
+    arrays['dE_dx'][start:end] = gradient_kernel(P, volumes, Dm_inv, dF_dx)
+    if hessian:
+        arrays['Kt'][start:end] = hessian_kernel(dP_dF, volumes, Dm_inv, dF_dx)
+
+
+class DofReduction:
+    '''
+    Elimination of the degrees of freedom (DOFs) of fixed vertices from the FEM system.
+
+    The reduction maps the nonzeros of the full stiffness matrix that it keeps to the CSC data
+    array of the reduced matrix, so the reduced matrix is gathered from the assembled data array
+    of the full one. It also maps vectors between the full (Nxd) layout and the reduced one.
+    '''
+    def __init__(self, fem: 'StaticFEM', boundary_conditions: array):
+        '''
+        The constructor takes as input the FEM solver (`fem`) and a boolean mask array over the
+        vertices (`boundary_conditions`). Vertices masked by True are fixed.
+        '''
+        # Extract vertices from the FEM solver
+        V = fem.mesh.vertices
+
+        # The mask of unconstrained coordinates and their indices in the full system
+        active_mask = (~boundary_conditions).repeat(V.shape[1])
+        active_indices = np.nonzero(active_mask)[0]
+        num_active = active_indices.size
+
+        self.shape = V.shape
+        self.active_mask = active_mask
+        self.active_indices = active_indices
+        self.num_active = num_active
+
+        # The sparsity pattern is unavailable in matrix-free mode
+        self.indptr = self.indices = self.nz_map = None
+        if fem.K_indices is None:
+            return
+
+        # Keep the nonzeros of the full matrix whose row and column are both unconstrained
+        reduced_index = np.cumsum(active_mask) - 1
+        K_cols = fem.K_columns()
+        nz_mask = active_mask[fem.K_indices] & active_mask[K_cols]
+        nz_map = np.nonzero(nz_mask)[0]
+
+        index_type = fem.K_indices.dtype
+        indices = reduced_index[fem.K_indices[nz_map]].astype(index_type)
+        cols = reduced_index[K_cols[nz_map]]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=num_active))))
+
+        self.indptr = indptr.astype(index_type)
+        self.indices = indices
+        self.nz_map = nz_map.astype(index_type)
+
+    def assemble(self, data: array) -> spmatrix:
+        '''
+        Assemble the reduced stiffness matrix from the CSC data array of the full stiffness
+        matrix.
+        '''
+        return csc_matrix((data[self.nz_map], self.indices, self.indptr),
+                          shape=(self.num_active, self.num_active))
+
+    def reduce(self, x: array) -> array:
+        '''
+        Extract the unconstrained coordinates from (..., N, d) arrays into (..., n) arrays, where
+        n is the number of unconstrained coordinates.
+        '''
+        return x.reshape(*x.shape[:-2], -1)[..., self.active_indices]
+
+    def expand(self, x: array) -> array:
+        '''
+        Scatter (..., n) arrays over the unconstrained coordinates back into (..., N, d) arrays,
+        leaving zeros at the fixed coordinates.
+        '''
+        x_full = np.zeros((*x.shape[:-1], self.shape[0] * self.shape[1]), dtype=x.dtype)
+        x_full[..., self.active_indices] = x
+        return x_full.reshape(*x.shape[:-1], *self.shape)
 
 
 class StaticFEM:
     '''
     Static analysis using the finite element method (FEM).
     '''
-    def __init__(self, mesh: TetMesh, material: Type[Material]):
+    def __init__(self, mesh: TetMesh, material: Type[Material],
+                 solver: Union[str, LinearSolver]='cg', preconditioner: str=None,
+                 matrix_free: bool=False, compact: bool=False, dtype: type=np.float64,
+                 num_workers: int=1, chunk_size: int=None, instrument: bool=False):
         '''
         The constructor takes as input a tet mesh (`mesh`) and a material model (`material`).
+        The linear solver backend (`solver`) is 'cg' (conjugate gradient), 'pcg' (preconditioned
+        conjugate gradient), 'direct' (sparse LU factorization), or a `LinearSolver` instance.
+        CG solvers optionally take a `preconditioner`: 'jacobi' (point Jacobi), 'block_jacobi'
+        (3x3 nodal block Jacobi) or 'ilu' (incomplete LU).
+
+        In `matrix_free` mode, the solvers never form the stiffness matrix. CG is given a linear
+        operator that applies K element by element instead, and neither dF/dx nor the sparsity
+        pattern of K is precomputed, so memory stays linear in the number of tets.
+
+        In `compact` mode, the dense dF/dx (Tx9x12) is not precomputed, and its contractions use
+        its structure instead. Neither is the scatter map of the sparsity pattern (576 bytes per
+        tet): the slots of element matrix entries are derived on the fly from the block indices
+        of the 16 vertex pairs of each tet (64 bytes per tet). Stiffness matrices are evaluated
+        and assembled in chunks of `chunk_size` elements (`COMPACT_CHUNK_SIZE` by default), so
+        the stress differentials and stiffness matrices of all elements are never held at once.
+        `dtype` sets the floating-point type of the stored per-tet values, e.g., np.float32 to
+        halve them. Computations still run in double precision.
+
+        Memory on a 40x16x16 Neo-Hookean cuboid with one boundary condition reduction, in bytes
+        per tet (peaks traced by tracemalloc, `evaluate` with the stiffness matrix):
+
+                                       default   compact   compact + float32
+            held after setup              2002       626         586
+            peak in the constructor       3301      1281        1241
+            peak in `evaluate`            4118       857         857
+
+        What compact mode still holds is mostly the row indices of the full and reduced patterns,
+        which the assembled matrices need anyway. Matrix-free mode holds about 130 bytes per tet.
+
+        With `num_workers` > 1, the energies, forces and stiffness matrices of tet elements are
+        evaluated in parallel by worker processes, each handling chunks of `chunk_size` elements
+        (by default, four chunks per worker). See `init_workers` for details.
+
+        With `instrument` enabled, the solver records the wall times and call counts of its
+        stages, iteration counts and residual histories in `self.instrumentation`, which exports
+        them via `to_dict` or `to_json`. Disabled instrumentation costs one flag check per call.
         '''
         # Extract vertices and tet elements from the input argument
         V, T = mesh.vertices, mesh.elements
@@ -27,37 +269,360 @@ class StaticFEM:
         # Constants
         dim, dim2 = V.shape[1], V.shape[1] ** 2
 
-        # Recall that F = Ds * Dm^(-1), where
-        #   - Ds = [x2 - x1, x3 - x1, x4 - x1] is the bases after deformation
-        #   - Dm = [X2 - X1, X3 - X1, X4 - X1] is the bases before deformation
-        # Here we precompute Dm^(-1) for all tet elements
-        tet_vertices = V[T.ravel()].reshape(-1, T.shape[1], dim)
-        Dm = (tet_vertices[:, 1:] - tet_vertices[:, [0]]).transpose(0, 2, 1)
-        Dm_inv = np.linalg.inv(Dm)
-
-        # Precompute dF/dx for all tet elements
-        # The formula is dF/dx = d(Ds * Dm^(-1))/dx = d(Ds)/dx * Dm^(-1)
-        ## Compute dF/dx1
-        dF_dx1 = np.eye(dim) * -Dm_inv.sum(axis=1).reshape(-1, dim, 1, 1)
-        dF_dx1 = dF_dx1.reshape(-1, dim2, dim)
-
-        ## Compute dF/d(x2, x3, ..., xm), where m is the simplex size (4 for a tet mesh)
-        dF_dx_others = np.eye(dim) * Dm_inv.transpose(0, 2, 1).reshape(-1, dim, dim, 1, 1)
-        dF_dx_others = dF_dx_others.transpose(0, 1, 3, 2, 4).reshape(-1, dim2, dim2)
-        dF_dx = np.dstack((dF_dx1, dF_dx_others))
-
-        # Precompute tet volumes
-        volumes = np.abs(np.linalg.det(Dm)) * (1 / 6)
+        # Create the linear solver. Matrix-free mode hands CG a linear operator, which
+        # preconditioners cannot be built from.
+        self.solver = make_solver(solver, **({} if preconditioner is None else
+                                             {'preconditioner': preconditioner}))
+        if matrix_free and not (isinstance(self.solver, ConjugateGradient) and
+                                self.solver.preconditioner_type is None):
+            raise ValueError(f"Matrix-free mode only supports the unpreconditioned CG solver, "
+                             f"got '{self.solver.name}'")
+
+        # Initialize the instrumentation
+        self.instrumentation = Instrumentation(enabled=instrument)
+
+        with self.instrumentation.timer('precomputation'):
+            # Recall that F = Ds * Dm^(-1), where
+            #   - Ds = [x2 - x1, x3 - x1, x4 - x1] is the bases after deformation
+            #   - Dm = [X2 - X1, X3 - X1, X4 - X1] is the bases before deformation
+            # Here we precompute Dm^(-1) for all tet elements
+            tet_vertices = V[T.ravel()].reshape(-1, T.shape[1], dim)
+            Dm = (tet_vertices[:, 1:] - tet_vertices[:, [0]]).transpose(0, 2, 1)
+
+            # Degenerate elements have (nearly) singular rest bases, which would blow up Dm^(-1).
+            # Their volumes are tiny relative to a regular tet with the same longest edge
+            signed_volumes, normalized_volume = normalized_volumes_from_bases(Dm)
+            degenerate = np.abs(normalized_volume) < DEGENERATE_TOLERANCE
+            if degenerate.any():
+                raise ValueError(f'The mesh has {degenerate.sum()} degenerate tet elements '
+                                 f'(e.g., element {degenerate.argmax()}). Remove them with '
+                                 f'mesh_quality.repair_elements first.')
+
+            Dm_inv = np.linalg.inv(Dm)
+
+            # Precompute dF/dx for all tet elements (skipped in matrix-free and compact modes)
+            # The formula is dF/dx = d(Ds * Dm^(-1))/dx = d(Ds)/dx * Dm^(-1)
+            if not matrix_free and not compact:
+                ## Compute dF/dx1
+                dF_dx1 = np.eye(dim) * -Dm_inv.sum(axis=1).reshape(-1, dim, 1, 1)
+                dF_dx1 = dF_dx1.reshape(-1, dim2, dim)
+
+                ## Compute dF/d(x2, x3, ..., xm), where m is the simplex size (4 for a tet mesh)
+                dF_dx_others = Dm_inv.transpose(0, 2, 1).reshape(-1, dim, dim, 1, 1)
+                dF_dx_others = np.eye(dim) * dF_dx_others
+                dF_dx_others = dF_dx_others.transpose(0, 1, 3, 2, 4).reshape(-1, dim2, dim2)
+                dF_dx = np.dstack((dF_dx1, dF_dx_others)).astype(dtype, copy=False)
+            else:
+                dF_dx = None
+
+            # Precompute tet volumes
+            volumes = np.abs(signed_volumes).astype(dtype, copy=False)
+            Dm_inv = Dm_inv.astype(dtype, copy=False)
+
+            # Precompute the global DOF indices of all tet elements, which map the i-th row/column
+            # of an element matrix to the dof_indices[t, i]-th row/column of the global matrix
+            dof_indices = (T[:, :, None] * dim + np.arange(dim)).reshape(T.shape[0], -1)
+            if V.size < np.iinfo(np.int32).max:
+                dof_indices = dof_indices.astype(np.int32)
 
         # Save the input arguments
         self.mesh = mesh
         self.material = material
+        self.matrix_free = matrix_free
+        self.compact = compact
+
+        # Record CG residual histories when instrumented
+        if instrument and isinstance(self.solver, ConjugateGradient):
+            self.solver.record_residuals = True
 
         # Save the precomputed values
         self.Dm_inv = Dm_inv
         self.dF_dx = dF_dx
         self.volumes = volumes
+        self.dof_indices = dof_indices
+
+        # Precompute the sparsity pattern of the stiffness matrix
+        self.K_indptr = self.K_indices = self.K_scatter = None
+        self.K_block_indptr = self.K_pairs = None
+        self.chunk_size = chunk_size
+        if not matrix_free:
+            self.init_sparsity_pattern()
+
+        # DOF reductions of the FEM system, keyed by boundary condition masks
+        self.reductions = {}
+
+        # Assembled stiffness matrices of constant-stiffness materials, keyed by boundary
+        # condition masks (None for the full matrix)
+        self.stiffness_cache = {}
+
+        # Start worker processes for parallel element evaluation
+        self.workers = None
+        if num_workers > 1:
+            self.init_workers(num_workers, chunk_size)
+
+    def init_workers(self, num_workers: int, chunk_size: int=None):
+        '''
+        Start a pool of worker processes for parallel element evaluation. The per-element
+        precomputed values (Dm^(-1), dF/dx and volumes), the vertex positions and the per-element
+        outputs live in shared memory, so workers read and write them without copying. The
+        element range is split into chunks of `chunk_size` elements which are dispatched to the
+        workers, and the main process reduces the per-element outputs into global forces and
+        stiffness matrices.
+
+        Call `close` to stop the workers and free the shared memory, which also happens when the
+        solver is garbage collected.
+        '''
+        # Store class member data into local variables
+        V, T = self.mesh.vertices, self.mesh.elements
+
+        # Check input validity
+        assert num_workers > 1, 'Parallel element evaluation needs at least 2 workers'
+
+        # Shared inputs and outputs
+        arrays = SharedArrays({
+            'vertices': V,
+            'elements': T,
+            'Dm_inv': self.Dm_inv,
+            'volumes': self.volumes,
+            'E': np.zeros(T.shape[0]),
+            'dE_dx': np.zeros(self.dof_indices.shape),
+        })
+        if self.dF_dx is not None:
+            arrays.add('dF_dx', self.dF_dx)
+        if not self.matrix_free:
+            arrays.add('Kt', np.zeros((T.shape[0], *self.dof_indices.shape[1:] * 2)))
+
+        # Replace the precomputed values by their shared copies to avoid storing them twice
+        self.Dm_inv, self.volumes = arrays['Dm_inv'], arrays['volumes']
+        if self.dF_dx is not None:
+            self.dF_dx = arrays['dF_dx']
+
+        # Split the elements into chunks
+        if chunk_size is None:
+            chunk_size = -(-T.shape[0] // (num_workers * 4))
+        self.chunks = chunk_ranges(T.shape[0], -(-T.shape[0] // chunk_size))
+
+        # Start the workers. The finalizer stops them if the solver is garbage collected.
+        self.workers = WorkerPool(arrays, num_workers)
+        self.workers_finalizer = weakref.finalize(self, self.workers.close)
+
+    def close(self):
+        '''
+        Stop the worker processes and free the shared memory. The solver keeps working in serial
+        mode afterwards.
+        '''
+        if self.workers is None:
+            return
+
+        # Move the precomputed values out of shared memory
+        self.Dm_inv, self.volumes = self.Dm_inv.copy(), self.volumes.copy()
+        if self.dF_dx is not None:
+            self.dF_dx = self.dF_dx.copy()
+
+        self.workers_finalizer()
+        self.workers = None
+
+    @timed('parallel_pass')
+    def parallel_pass(self, vertices: array, hessian: bool=False) -> Tuple[array, array, array]:
+        '''
+        Evaluate all tet elements in parallel at the current vertex positions.
+
+        Return values:
+            * `E: array`     - (T) strain energies of tet elements
+            * `dE_dx: array` - (Tx12) gradients of the element energies w.r.t. their vertices
+            * `Kt: array`    - (Tx12x12) element stiffness matrices, None if `hessian` is False
+
+        The returned arrays are views into shared memory, which are overwritten by the next pass.
+        '''
+        arrays = self.workers.arrays
+
+        # Publish the vertex positions and evaluate the chunks across the workers
+        arrays['vertices'][:] = vertices
+        tasks = [(start, end, self.material, hessian) for start, end in self.chunks]
+        self.workers.map(evaluate_chunk, tasks)
+
+        return arrays['E'], arrays['dE_dx'], arrays['Kt'] if hessian else None
+
+    @timed('sparsity_pattern')
+    def init_sparsity_pattern(self):
+        '''
+        Precompute the sparsity pattern of the stiffness matrix K in CSC format. The mesh
+        connectivity never changes, so neither does the pattern. Every entry of every element
+        matrix is mapped to its slot in the CSC data array by `K_scatter`, so assembling K only
+        takes a single scatter-add into the data array.
+
+        The pattern consists of dxd blocks, one per pair of vertices that share an element, so it
+        is derived from the m^2 vertex pairs of every element rather than its (md)^2 entries. In
+        compact mode, only the block indices of the vertex pairs (`K_pairs`) are stored, and the
+        slots of chunks of elements are derived from them on the fly (see `scatter_kernel`).
+        '''
+        V, T = self.mesh.vertices, self.mesh.elements
+        num_vertices, dim = V.shape
+
+        # Find the blocks, i.e., the distinct (row, column) vertex pairs of all elements
+        keys = T[:, None, :].astype(np.int64) * num_vertices + T[:, :, None]
+        block_keys, pairs = np.unique(keys.ravel(), return_inverse=True)
+        del keys
+
+        # Use 32-bit indices when they fit
+        num_blocks = block_keys.size
+        index_type = np.int32 if num_blocks * dim ** 2 < np.iinfo(np.int32).max else np.int64
+        pairs = pairs.reshape(T.shape[0], -1).astype(index_type)
+
+        block_rows = (block_keys % num_vertices).astype(index_type)
+        block_cols = (block_keys // num_vertices).astype(index_type)
+        block_counts = np.bincount(block_cols, minlength=num_vertices).astype(index_type)
+        block_indptr = np.concatenate(([0], np.cumsum(block_counts))).astype(index_type)
+        del block_keys
+
+        # Expand the blocks into the CSC pattern over DOFs. Column q of vertex j starts after the
+        # d columns of all previous vertices and the q previous columns of vertex j.
+        components = np.arange(dim, dtype=index_type)
+        K_indptr = np.empty(V.size + 1, dtype=index_type)
+        K_indptr[:-1] = (dim ** 2 * block_indptr[:-1, None] +
+                         dim * block_counts[:, None] * components).ravel()
+        K_indptr[-1] = num_blocks * dim ** 2
+
+        # Entry (p, q) of block k in vertex column j holds row d * block_rows[k] + p (see
+        # `scatter_kernel` for its position)
+        position = (dim * np.arange(num_blocks, dtype=index_type) +
+                    (dim * (dim - 1)) * block_indptr[block_cols])[:, None, None] + \
+            (dim * block_counts[block_cols])[:, None, None] * components[:, None] + components
+        K_indices = np.empty(num_blocks * dim ** 2, dtype=index_type)
+        K_indices[position.ravel()] = np.broadcast_to(
+            (dim * block_rows)[:, None, None] + components, position.shape).ravel()
+
+        self.K_indptr = K_indptr
+        self.K_indices = K_indices
+        self.K_block_indptr = block_indptr
+
+        # Store the full scatter map, the largest per-tet array, unless in compact mode
+        if self.compact:
+            self.K_pairs = pairs
+        else:
+            self.K_scatter = scatter_kernel(pairs, T, block_indptr, dim).ravel()
+
+    def element_scatter(self, start: int, end: int) -> array:
+        '''
+        Get the slots of the entries of the stiffness matrices of elements [start, end) in the
+        CSC data array of the stiffness matrix, as a flat array.
+        '''
+        T = self.mesh.elements
+        if self.K_scatter is not None:
+            return self.K_scatter.reshape(T.shape[0], -1)[start:end].ravel()
+        return scatter_kernel(self.K_pairs[start:end], T[start:end], self.K_block_indptr,
+                              self.mesh.vertices.shape[1]).ravel()
+
+    def K_columns(self) -> array:
+        '''
+        Compute the column index of every nonzero of the stiffness matrix from the sparsity
+        pattern, which is not stored to save memory.
+        '''
+        num_dofs = self.K_indptr.size - 1
+        return np.repeat(np.arange(num_dofs, dtype=self.K_indices.dtype), np.diff(self.K_indptr))
+
+    def reduction(self, boundary_conditions: array) -> DofReduction:
+        '''
+        Get the reduction of the FEM system where the DOFs of fixed vertices are removed. The
+        reduction is computed once per boundary condition mask and then cached.
+
+        Params:
+            * `boundary_conditions: array` - (N), a boolean mask array over the vertices. Those
+                masked by True are assumed to be fixed and excluded from the solver.
+        '''
+        key = boundary_key(boundary_conditions)
+        if key not in self.reductions:
+            with self.instrumentation.timer('reduction'):
+                self.reductions[key] = DofReduction(self, boundary_conditions)
+        return self.reductions[key]
+
+    def deformation_gradients(self, vertices: array) -> array:
+        '''
+        Compute the deformation gradients of all tet elements at current vertex positions.
+
+        Params:
+            * `vertices: array` - (Nxd) current vertex positions, N = #vertices, d = #dimensions
+
+        Return value:
+            * `F: array` - (Txdxd) deformation gradients, T = #elements
+        '''
+        return deformation_gradient_kernel(vertices, self.mesh.elements, self.Dm_inv)
+
+    @timed('element_fields')
+    def element_fields(self, vertices: array) -> Dict[str, array]:
+        '''
+        Compute the strain and stress fields of all tet elements at current vertex positions in
+        one vectorized pass, e.g., for checking the stresses of a solution against the yield
+        strength.
+
+        Params:
+            * `vertices: array` - (Nxd) current vertex positions, N = #vertices, d = #dimensions
+
+        Return value:
+            * `fields: Dict[str, array]` - per-element fields, T = #elements:
+                * `F` - (Txdxd) deformation gradients
+                * `strain` - (Txdxd) Green-Lagrange strain tensors
+                * `equivalent_strain` - (T) von Mises equivalent strains
+                * `P` - (Txdxd) first Piola-Kirchhoff stress tensors
+                * `cauchy` - (Txdxd) Cauchy stress tensors
+                * `von_mises` - (T) von Mises stresses
+                * `energy_density` - (T) strain energy densities
+        '''
+        # Check input validity
+        assert vertices.shape == self.mesh.vertices.shape, \
+            f'The passed-in vertices must match the shape of tet vertices. Expected ' \
+            f'{self.mesh.vertices.shape} but got {vertices.shape} instead'
+
+        # Evaluate the material model once for all tet elements
+        F = self.deformation_gradients(vertices)
+        W, P, _ = self.material.evaluate_batch(F)
+        sigma = self.material.cauchy_stress_batch(F, P)
+        E = green_lagrange_strain(F)
+
+        return {
+            'F': F,
+            'strain': E,
+            'equivalent_strain': equivalent_strain(E),
+            'P': P,
+            'cauchy': sigma,
+            'von_mises': von_mises_stress(sigma),
+            'energy_density': W,
+        }
+
+    def vertex_fields(self, element_fields: Dict[str, array]) -> Dict[str, array]:
+        '''
+        Average per-element fields at the vertices, weighting each element by its volume.
+
+        Params:
+            * `element_fields: Dict[str, array]` - fields with a leading dimension of T, T =
+                #elements, e.g., the output of `element_fields`
 
+        Return value:
+            * `fields: Dict[str, array]` - fields with a leading dimension of N, N = #vertices.
+                Vertices not referenced by any element get zeros.
+        '''
+        T = self.mesh.elements
+        num_vertices = self.mesh.vertices.shape[0]
+
+        # Every element adds its volume-weighted value to its four vertices
+        vertex_indices = T.ravel()
+        weights = np.repeat(self.volumes.astype(np.float64), T.shape[1])
+        total_weights = np.bincount(vertex_indices, weights=weights, minlength=num_vertices)
+        total_weights[total_weights == 0] = 1
+
+        fields = {}
+        for name, values in element_fields.items():
+            values = values.reshape(T.shape[0], -1)
+            averaged = np.stack([
+                np.bincount(vertex_indices, weights=np.repeat(column, T.shape[1]) * weights,
+                            minlength=num_vertices)
+                for column in values.T
+            ], axis=1) / total_weights[:, None]
+            fields[name] = averaged.reshape(num_vertices, *element_fields[name].shape[1:])
+
+        return fields
+
+    @timed('elastic_force')
     def elastic_force(self, vertices: array) -> array:
         '''
         Compute the internal elastic force at current vertex positions.
@@ -66,229 +631,431 @@ class StaticFEM:
             * `vertices: array` - (Nxd) current vertex positions, N = #vertices, d = #dimensions
 
         Return value:
-            * `f: spmatrix` - (Nxd) the elastic force matrix
+            * `f: array` - (Nxd) the elastic force matrix
         '''
         # Store class member data into local variables
         V = self.mesh.vertices      # (Nx3), N = #vertices
-        T = self.mesh.elements      # (Tx4), T = #elements
 
         material = self.material    # Material model
 
-        Dm_inv = self.Dm_inv        # (Tx3x3), Dm^(-1)
-        dF_dx = self.dF_dx          # (Tx9x12), dF/dx
-        volumes = self.volumes      # (T), volumes of tet elements
+        # Check input validity
+        assert vertices.shape == V.shape, \
+            f'The passed-in vertices must match the shape of tet vertices. Expected {V.shape} ' \
+            f'but got {vertices.shape} instead'
+
+        # The elastic forces are the negative gradient of the strain energy
+        if self.workers is not None:
+            f = -self.scatter_gradients(self.parallel_pass(vertices)[1])
+
+        # Compute the deformation gradients and stress tensors of all tet elements
+        else:
+            F = self.deformation_gradients(vertices)
+            P = material.stress_tensor_batch(F)
+            f = -self.nodal_gradient(P)
+
+        # Suppress negative zeroes
+        f = np.where(np.abs(f) < 1e-8, 0, f)
+        return f
+
+    @timed('strain_energy')
+    def strain_energy(self, vertices: array) -> float:
+        '''
+        Compute the total strain energy of the mesh given the current vertex positions, i.e., the
+        sum of `volume * W(F)` over all tet elements.
+
+        Params:
+            * `vertices: array` - (Nxd) current vertex positions, N = #vertices, d = #dimensions
+
+        Return value:
+            * `E: float` - the total strain energy. It can be NaN if some tet elements are
+                inverted and the material model is undefined there (e.g., Neo-Hookean).
+        '''
+        # Store class member data into local variables
+        V = self.mesh.vertices      # (Nx3), N = #vertices
 
         # Check input validity
         assert vertices.shape == V.shape, \
             f'The passed-in vertices must match the shape of tet vertices. Expected {V.shape} ' \
             f'but got {vertices.shape} instead'
 
-        # Constants
-        num_tets = T.shape[0]
-        dim = V.shape[1]
+        # Evaluate the element energies in parallel
+        if self.workers is not None:
+            return float(self.parallel_pass(vertices)[0].sum())
 
-        # Initialize the force matrix
-        f = np.zeros_like(V)
+        # Compute the energy densities of all tet elements and integrate them over the volumes
+        F = self.deformation_gradients(vertices)
+        W = self.material.energy_density_batch(F)
+        return float(W @ self.volumes)
 
-        # Iterate over all tet elements
-        for t in range(num_tets):
-            # Compute the deformation gradient F
-            tet_indices = T[t]
-            tet_vertices = vertices[tet_indices]
-            F = (tet_vertices[1:] - tet_vertices[0]).T @ Dm_inv[t]
+    def nodal_gradient(self, P: array) -> array:
+        '''
+        Compute the gradient of the strain energy w.r.t. vertex positions from per-element stress
+        tensors, i.e., the sum of `volume * P : dF/dx` over all tet elements.
 
-            # Compute dE/dx
-            P = material.stress_tensor(F)
-            dE_dx = volumes[t] * P.T.ravel() @ dF_dx[t]
+        Params:
+            * `P: array` - (Txdxd) stress tensors (or their differentials), T = #elements
 
-            # Add the nodal forces to the force matrix f
-            f[tet_indices] -= dE_dx.reshape(-1, dim)
+        Return value:
+            * `dE_dx: array` - (Nxd) the nodal gradient, N = #vertices
+        '''
+        # Compute dE/dx = volume * P * dF/dx for all tet elements
+        dE_dx = gradient_kernel(P, self.volumes, self.Dm_inv, self.dF_dx)
+        return self.scatter_gradients(dE_dx)
 
-        # Suppress negative zeroes
-        f = np.where(np.abs(f) < 1e-8, 0, f)
-        return f
+    def scatter_gradients(self, dE_dx: array) -> array:
+        '''
+        Sum (Tx12) per-element gradients into an (Nxd) nodal gradient in one scatter-add.
+        '''
+        V = self.mesh.vertices      # (Nx3), N = #vertices
+        dE_dx = np.bincount(self.dof_indices.ravel(), weights=dE_dx.ravel(), minlength=V.size)
+        return dE_dx.reshape(V.shape)
 
-    def stiffness_matrix(self, vertices: array) -> spmatrix:
+    @timed('element_stiffness')
+    def element_stiffness(self, vertices: array) -> array:
         '''
-        Compute the stiffness matrix given the current vertex positions.
+        Compute the contributions of all tet elements to the stiffness matrix.
 
         Params:
             * `vertices: array` - (Nxd) current vertex positions, N = #vertices, d = #dimensions
 
         Return value:
-            * `K: spmatrix` - (Nd x Nd) the sparse stiffness matrix
+            * `Kt: array` - (Tx12x12) element stiffness matrices, T = #elements
         '''
         # Store class member data into local variables
         V = self.mesh.vertices      # (Nx3), N = #vertices
-        T = self.mesh.elements      # (Tx4), T = #elements
 
         material = self.material    # Material model
 
-        Dm_inv = self.Dm_inv        # (Tx3x3), Dm^(-1)
-        dF_dx = self.dF_dx          # (Tx9x12), dF/dx
-        volumes = self.volumes      # (T), volumes of tet elements
-
         # Check input validity
         assert vertices.shape == V.shape, \
             f'The passed-in vertices must match the shape of tet vertices. Expected {V.shape} ' \
             f'but got {vertices.shape} instead'
+        assert not self.matrix_free, 'The stiffness matrix is not available in matrix-free mode'
 
-        # Constants
-        num_vertices, num_tets = V.shape[0], T.shape[0]
-        dim, simplex_size = V.shape[1], T.shape[1]
-
-        # Initialize an empty list of triplets for the output sparse matrix
-        triplets = [] # modified this line: triplets: List[int, int, float] = [[0, 0, 0.0]]
-
-        # Iterate over all tet elements
-        for t in range(num_tets):
-            # Compute the deformation gradient F
-            # Formula: F = Ds * Dm^(-1), where
-            #   - Dm = [x2 - x1, x3 - x1, x4 - x1] is the bases after deformation
-            #   - Ds = [X2 - X1, X3 - X1, X4 - X1] is the bases before deformation
-            # We have precomputed Dm^(-1) in the constructor, now we only care about Ds
-            # --------
-            # TODO: Your code here. The steps for computing F are as follows:
-            #   1. Get the vertices of the current tet element, dubbed as `tet_vertices`
-            #   2. Compute Ds
-            #   3. Compute F using the formula
-            # HINT:
-            #   - Consider how to index or slice the matrices to perform vectorized calculation,
-            #     i.e., conducting multiple concurrent math operations using a single Python
-            #     operator. For example,
-            #       * The addtion of two vectors `a` and `b` is simply written as `c = a + b`,
-            #         where c[i] = a[i] + b[i]
-            #       * The row-wise addtion of matrix `A` and vector `b` is written as `C = A + b`,
-            #         where C[i, j] = a[i, j] + b[j]
-            #   - Use `A.T` or `np.transpose(A)` to transpose a 2D array A
-            #   - Use the `@` operator for matrix multiplication
-            tet_vertices = vertices[T[t]]
-            Ds =  tet_vertices[1:] - tet_vertices[0]   # <-- Ds is defined as the basis after deformation and for a single tetrahedron element
-            F = Ds.T @ Dm_inv[t]     # <-- Check if Ds needs to be transpose Ds.T
-
-            # Compute tet element t's contribution to the stiffness matrix K
-            # Formula: Kt = d^2(Et)/d(xt)^2, where
-            #   - Et (scalar) is the strain energy of t
-            #   - xt (4x3) is the vertex positions of t, represented by the varaible `tet_vertices`
-            #   - Kt (12x12) is the contribtion from t to K
-            # If we apply the chain rule (the subscript t is omitted for simplicity):
-            #   dE/dx = volume * dW/dx
-            #         = volume * dW/dF * dF/dx
-            #         = volume * P * dF/dx
-            #   d^E/dx^2 = volume * d(P * dF/dx)/dx
-            #            = volume * dP/dx * dF/dx            (d^2F/dx^2 is zero, can you see why?)
-            #            = volume * (dP/dF * dF/dx) * dF/dx
-
-            # Let's first prepare the operands
-            # --------
-            # TODO: Your code here. Get the volume of t, dP/dF and dF/dx.
-            vol = volumes[t]       # <--
-            dP_dF = material.stress_differential(F)     # <--
-            dF_dxt = dF_dx[t]    # <--
+        # Evaluate the element stiffness matrices in parallel
+        if self.workers is not None:
+            return self.parallel_pass(vertices, hessian=True)[2]
 
-            # Compute Kt using the formula above
-            # --------
-            # TODO: Your code here. Compute Kt in two steps:
-            #   1. Compute dP/dx = dP/dF * dF/dx
-            #   2. Compute Kt = volume * dP/dx * dF/dx
-            # HINT:
-            #   - Use the `@` operator for matrix multiplication
-            #   - Some matrix should be transposed in Step 2
-            dP_dxt = dP_dF @ dF_dxt   # <--
-            Kt = vol * dP_dxt.T @  dF_dxt #np.zeros((simplex_size * dim, simplex_size * dim))     # <-- should be a 12x12
-            #print(f"Kt{Kt.shape}")
-            
-
-            # Suppress negative zeroes
-            Kt = np.where(np.abs(Kt) < 1e-8, 0, Kt) 
-
-            # Assign the elements of Kt to their right positions in the global matrix K
-            #
-            # Just like HW3, K is represented by a list of triplets (row_ind, col_ind, val) which
-            # refers to the row index, column index, and the value of each element. Note that
-            # triplets associated with the same element index (row_ind, col_ind) are summed up
-            # automatically when creating the sparse matrix.
-            #
-            # Therefore, we can simply create m^2 triplets for every Kt assuming that Kt is a mxm
-            # matrix. To avoid writing deep nested loops in Python (very slow), let's adopt
-            # the following strategy:
-            #   1. Figure out an index mapping from Kt to K, dubbed as `index_map`. `index_map` is
-            #      a array of length m and maps the i-th row/column in Kt to the index_map[i]-th
-            #      row/column in K. Mathematically, m = `simplex_size * dim`.
-            #   2. Iterate over all elements in Kt to create cooresponding triplets for K. This
-            #      step only requires a double nested loop.
-
-            # Construct the index mapping from Kt to K
-            # --------
-            # TODO: Your code here. Implement step 1.
-            # T[t] = vertices from the tetrahedron
-            # repeat each vertex index dim times (degree of freedom) -get starting indices and offset starting indices
-            index_map = np.repeat(T[t] * dim, dim) + np.tile(np.arange(dim), len(T[t]))
-            #m = Kt.shape[0] #(row_ind, col_ind, val)
-            #index_map = np.zeros(m, dtype=np.int64)
-            
-            #for i in range(Kt.shape[0]):        # <--
-            #    for j in range(Kt.shape[1]):    # <-- 
-            #        local_index = i * dim + j         # <--
-            #        index_map[local_index] = global_vertex_indices[i] * dim + j
-
-            # Create m^2 triplets for K
-            # --------
-            # TODO: Your code here. Implement step 2.
-            for i in range(Kt.shape[0]):        # <--
-                for j in range(Kt.shape[1]):    # <--
-                    if Kt[i, j] != 0:
-                        triplets.append((index_map[i], index_map[j], Kt[i, j])) # <--
-
-        # Construct the sparse matrix K
-        row_inds, col_inds, vals = list(zip(*triplets))
-        K = csc_matrix((vals, (row_inds, col_inds)),
-                       shape=(num_vertices * dim, num_vertices * dim))
-        
-        #print(f"K size:{K}")
-        #print(f"K size:{K.shape}")
+        # Compute the deformation gradients of all tet elements
+        F = self.deformation_gradients(vertices)
+
+        # Compute dP/dF for all tet elements
+        dP_dF = material.stress_differential_batch(F)
+        return self.element_hessians(dP_dF)
+
+    def element_hessians(self, dP_dF: array) -> array:
+        '''
+        Compute the element stiffness matrices from per-element stress differentials.
+
+        Params:
+            * `dP_dF: array` - (Txd^2xd^2) gradients of the stress tensors w.r.t. F, T = #elements
+
+        Return value:
+            * `Kt: array` - (Tx12x12) element stiffness matrices
+        '''
+        return hessian_kernel(dP_dF, self.volumes, self.Dm_inv, self.dF_dx)
+
+    @timed('assembly')
+    def assemble_stiffness(self, Kt: array, boundary_conditions: array=None) -> spmatrix:
+        '''
+        Sum element stiffness matrices into the sparse stiffness matrix.
+
+        Params:
+            * `Kt: array`                  - (Tx12x12) element stiffness matrices
+            * `boundary_conditions: array` - (N), optional boolean mask array over the vertices.
+                If given, the DOFs of vertices masked by True are removed from the matrix.
+
+        Return value:
+            * `K: spmatrix` - (Nd x Nd) the sparse stiffness matrix, or the reduced matrix over
+                unconstrained DOFs if `boundary_conditions` is given
+        '''
+        return self.stiffness_from_data(self.scatter_stiffness(Kt), boundary_conditions)
+
+    def scatter_stiffness(self, Kt: array, start: int=0, data: array=None) -> array:
+        '''
+        Sum the (Cx12x12) stiffness matrices of elements [start, start + C) into the CSC data
+        array of the full stiffness matrix. Entries with the same (row_ind, col_ind) share the
+        same slot in the precomputed sparsity pattern.
+
+        Params:
+            * `Kt: array`    - (Cx12x12) element stiffness matrices
+            * `start: int`   - index of the first element
+            * `data: array`  - CSC data array to add to (optional, a new one by default)
+
+        Return value:
+            * `data: array` - the CSC data array
+        '''
+        num_elements, num_nonzeros = self.mesh.elements.shape[0], self.K_indices.size
+        scatter = self.element_scatter(start, start + Kt.shape[0])
+
+        # All elements at once
+        if data is None and Kt.shape[0] == num_elements:
+            return np.bincount(scatter, weights=Kt.ravel(), minlength=num_nonzeros)
+
+        # A chunk of nearby elements only touches a narrow window of the data array
+        if data is None:
+            data = np.zeros(num_nonzeros)
+        lo, hi = int(scatter.min()), int(scatter.max()) + 1
+        data[lo:hi] += np.bincount(scatter - lo, weights=Kt.ravel(), minlength=hi - lo)
+        return data
+
+    def stiffness_from_data(self, data: array, boundary_conditions: array=None) -> spmatrix:
+        '''
+        Build the sparse stiffness matrix from its CSC data array, or the reduced matrix over
+        unconstrained DOFs if `boundary_conditions` is given.
+        '''
+        if boundary_conditions is not None:
+            return self.reduction(boundary_conditions).assemble(data)
+
+        num_dofs = self.mesh.vertices.size
+        return csc_matrix((data, self.K_indices, self.K_indptr), shape=(num_dofs, num_dofs))
+
+    @timed('element_stiffness')
+    def chunked_stiffness_data(self, vertices: array) -> array:
+        '''
+        Compute the CSC data array of the full stiffness matrix at current vertex positions by
+        evaluating and scattering the element stiffness matrices in chunks of `chunk_size`
+        elements, so that the per-element stress differentials and stiffness matrices are never
+        held for all elements at once.
+        '''
+        T = self.mesh.elements
+        chunk_size = self.chunk_size or COMPACT_CHUNK_SIZE
+
+        data = np.zeros(self.K_indices.size)
+        for start, end in chunk_ranges(T.shape[0], -(-T.shape[0] // chunk_size)):
+            Dm_inv, volumes = self.Dm_inv[start:end], self.volumes[start:end]
+            F = deformation_gradient_kernel(vertices, T[start:end], Dm_inv)
+            dP_dF = self.material.stress_differential_batch(F)
+            self.scatter_stiffness(hessian_kernel(dP_dF, volumes, Dm_inv), start, data)
+
+        return data
+
+    @timed('stiffness_matrix')
+    def stiffness_matrix(self, vertices: array, boundary_conditions: array=None) -> spmatrix:
+        '''
+        Compute the stiffness matrix given the current vertex positions.
+
+        Params:
+            * `vertices: array`            - (Nxd) current vertex positions, N = #vertices,
+                d = #dimensions
+            * `boundary_conditions: array` - (N), optional boolean mask array over the vertices.
+                If given, the DOFs of vertices masked by True are removed from the matrix.
+
+        Return value:
+            * `K: spmatrix` - (Nd x Nd) the sparse stiffness matrix, or the reduced matrix over
+                unconstrained DOFs if `boundary_conditions` is given. For materials with constant
+                stiffness, the returned matrix is cached and must not be modified in place.
+        '''
+        # Materials with a constant Hessian yield the same K at any vertex positions, so the
+        # assembled and reduced matrices are cached and shared across calls
+        cache = self.stiffness_cache if self.material.constant_stiffness else {}
+        key = None if boundary_conditions is None else boundary_key(boundary_conditions)
+        if key in cache:
+            self.instrumentation.count('stiffness_cache_hits')
+            return cache[key]
+
+        # Compute element contributions and sum them into the sparse matrix. In compact mode, this
+        # happens in chunks of elements unless the elements are evaluated in parallel.
+        if self.compact and self.workers is None:
+            K = self.stiffness_from_data(self.chunked_stiffness_data(vertices),
+                                         boundary_conditions)
+        else:
+            K = self.assemble_stiffness(self.element_stiffness(vertices), boundary_conditions)
+        cache[key] = K
         return K
 
-    def solve_linear(self, external_forces: array, boundary_conditions: array) -> array:
+    @timed('evaluate')
+    def evaluate(self, vertices: array, boundary_conditions: array=None,
+                 hessian: bool=False) -> Tuple[float, array, Union[spmatrix, LinearOperator]]:
+        '''
+        Compute the total strain energy, the elastic forces and optionally the stiffness matrix in
+        one pass, which gathers tet vertices and evaluates the material model only once.
+
+        Params:
+            * `vertices: array`            - (Nxd) current vertex positions, N = #vertices,
+                d = #dimensions
+            * `boundary_conditions: array` - (N), optional boolean mask array over the vertices.
+                If given, the DOFs of vertices masked by True are removed from the matrix.
+            * `hessian: bool`              - whether to also compute the stiffness matrix
+
+        Return value:
+            * `E: float`    - the total strain energy
+            * `f: array`    - (Nxd) the elastic force matrix
+            * `K: spmatrix` - the (reduced) stiffness matrix as returned by `system_matrix`, or
+                None if `hessian` is False
+        '''
+        # Store class member data into local variables
+        V = self.mesh.vertices      # (Nx3), N = #vertices
+
+        material = self.material    # Material model
+
+        # Check input validity
+        assert vertices.shape == V.shape, \
+            f'The passed-in vertices must match the shape of tet vertices. Expected {V.shape} ' \
+            f'but got {vertices.shape} instead'
+
+        # The stiffness matrix is fused into the pass unless it is cached (constant stiffness),
+        # never assembled (matrix-free mode) or assembled in chunks (serial compact mode)
+        fused = hessian and not self.matrix_free and not material.constant_stiffness and \
+            not (self.compact and self.workers is None)
+
+        # Evaluate all tet elements in parallel and reduce the results
+        if self.workers is not None:
+            E_t, dE_dx, Kt = self.parallel_pass(vertices, hessian=fused)
+            E = float(E_t.sum())
+            f = -self.scatter_gradients(dE_dx)
+
+        # Evaluate the material model at the deformation gradients of all tet elements
+        else:
+            F = self.deformation_gradients(vertices)
+            W, P, dP_dF = material.evaluate_batch(F, differential=fused)
+
+            # Compute the total strain energy, the elastic forces and the element stiffness
+            E = float(W @ self.volumes)
+            f = -self.nodal_gradient(P)
+            Kt = self.element_hessians(dP_dF) if fused else None
+
+        # Suppress negative zeroes
+        f = np.where(np.abs(f) < 1e-8, 0, f)
+
+        # Compute the stiffness matrix
+        if fused:
+            K = self.assemble_stiffness(Kt, boundary_conditions)
+        elif hessian:
+            K = self.system_matrix(vertices, boundary_conditions)
+        else:
+            K = None
+
+        return E, f, K
+
+    @timed('stiffness_operator')
+    def stiffness_operator(self, vertices: array,
+                           boundary_conditions: array=None) -> LinearOperator:
+        '''
+        Build a matrix-free linear operator of the stiffness matrix at the current vertex
+        positions. The product K * v is computed element by element, vectorized over all tets,
+        via K * v = sum(volume * dP : dF/dx) where dF = dF/dx * v and dP = dP/dF : dF.
+
+        Params:
+            * `vertices: array`            - (Nxd) current vertex positions, N = #vertices,
+                d = #dimensions
+            * `boundary_conditions: array` - (N), optional boolean mask array over the vertices.
+                If given, the DOFs of vertices masked by True are removed from the operator.
+
+        Return value:
+            * `K: LinearOperator` - (Nd x Nd) operator of K, or of the reduced matrix over
+                unconstrained DOFs if `boundary_conditions` is given
+        '''
+        # Store class member data into local variables
+        V = self.mesh.vertices      # (Nx3), N = #vertices
+
+        # Check input validity
+        assert vertices.shape == V.shape, \
+            f'The passed-in vertices must match the shape of tet vertices. Expected {V.shape} ' \
+            f'but got {vertices.shape} instead'
+
+        # The reduction over unconstrained coordinates
+        if boundary_conditions is None:
+            boundary_conditions = np.zeros(V.shape[0], dtype=bool)
+        reduction = self.reduction(boundary_conditions)
+        num_active = reduction.num_active
+
+        # Linearize the stress tensors at the current deformation gradients
+        dP_dF = self.material.stress_differential_operator(self.deformation_gradients(vertices))
+
+        def matvec(v: array) -> array:
+            self.instrumentation.count('operator_products')
+
+            # The deformation gradient is linear in vertex positions, so dF is obtained by
+            # applying the same formula to the full-size displacement field
+            dF = self.deformation_gradients(reduction.expand(v.ravel()))
+            Kv = self.nodal_gradient(dP_dF(dF))
+            return reduction.reduce(Kv)
+
+        return LinearOperator((num_active, num_active), matvec=matvec, dtype=V.dtype)
+
+    def system_matrix(self, vertices: array, boundary_conditions: array):
+        '''
+        Get the reduced stiffness matrix used by the solvers, which is a matrix-free linear
+        operator in matrix-free mode and an assembled sparse matrix otherwise.
+        '''
+        if self.matrix_free:
+            return self.stiffness_operator(vertices, boundary_conditions)
+        return self.stiffness_matrix(vertices, boundary_conditions)
+
+    def linear_solve(self, A: Union[spmatrix, LinearOperator], b: array, x0: array=None,
+                     tol: float=None) -> Tuple[array, Dict]:
+        '''
+        Solve the linear equation A * x = b using the linear solver backend. A warning is printed
+        if the solver fails, and the solver statistics are recorded by the instrumentation.
+
+        Return values:
+            * `x: array`     - the solution vector
+            * `stats: dict`  - linear solver statistics
+        '''
+        instrumentation = self.instrumentation
+
+        with instrumentation.timer('linear_solve'):
+            x, stat = self.solver.solve(A, b, x0=x0, tol=tol)
+        if stat['status'] != 0:
+            print(f"Warning - {stat['solver']} solver failed with status {stat['status']}")
+
+        instrumentation.count('linear_iterations', stat['iterations'])
+        instrumentation.record('linear_residuals', stat['residual'])
+        if 'residual_history' in stat:
+            instrumentation.record('cg_residual_histories', stat['residual_history'])
+        return x, stat
+
+    @timed('solve_linear')
+    def solve_linear(self, external_forces: array, boundary_conditions: array,
+                     return_stats: bool=False) -> Union[array, Tuple[array, List[Dict]]]:
         '''
         Solve mesh deformation from the linear equations K * U = f_ext.
 
         Params:
-            * `external_forces: array`     - (Nxd), external forces, N = #vertices, d = #dimensions
+            * `external_forces: array`     - (Nxd) or (kxNxd), external forces, N = #vertices,
+                d = #dimensions. A stack of k force fields is solved as k load cases against the
+                same stiffness matrix.
             * `boundary_conditions: array` - (N), a boolean mask array over the vertices. Those
                 masked by True are assumed to be fixed and excluded from the solver.
+            * `return_stats: bool`         - whether to also return the linear solver statistics
 
         Return Value:
-            * `U: array` - (Nxd), deformation matrix
+            * `U: array`            - (Nxd) or (kxNxd), deformation matrix of each load case
+            * `stats: List[Dict]`   - linear solver statistics of each load case (optional)
         '''
         # Store class member data into local variables
         V = self.mesh.vertices      # (Nx3), N = #vertices
-        dim = V.shape[1]            # d = #dimensions
 
-        # Compute the stiffness matrix
-        K_full = self.stiffness_matrix(V)
+        # Check input validity
+        assert external_forces.shape[-2:] == V.shape and external_forces.ndim <= 3, \
+            f'The external forces must have shape {V.shape} or (k, *{V.shape}) but got ' \
+            f'{external_forces.shape} instead'
 
-        # Apply boundary conditions by removing fixed points
-        active_mask = (~boundary_conditions).repeat(dim)    # The mask of unconstrained coordinates
-        active_indices = np.nonzero(active_mask)[0]         # Indices of unconstrained coordinates
+        # Compute the stiffness matrix with boundary conditions applied by removing fixed points
+        reduction = self.reduction(boundary_conditions)     # Elimination of fixed coordinates
+        K = self.system_matrix(V, boundary_conditions)      # The actual stiffness matrix we use
 
-        K = K_full[active_indices][:, active_indices]       # The actual stiffness matrix we use
-        f_ext = external_forces.ravel()[active_mask]        # The actual external forces we use
+        # The actual external forces we use, one row per load case
+        f_ext = reduction.reduce(external_forces.reshape(-1, *V.shape))
 
-        # Solve the linear equation using the conjugate gradient method
-        U, stat = conjugate_gradient(K, f_ext)
-        if stat != 0:
-            print('Warning - CG solver failed with status', stat)
-        else:
-            print('CG solver finished')
+        # Solve the linear equation of each load case. Direct solvers factorize K only once.
+        U = np.zeros(f_ext.shape)
+        stats = []
+        for i, f_ext_i in enumerate(f_ext):
+            U[i], stat = self.linear_solve(K, f_ext_i)
+            stats.append(stat)
 
         # Obtain the full-size deformation matrix
-        U_full = np.zeros_like(V)
-        U_full.ravel()[active_mask] = U
-        return U_full
+        U_full = reduction.expand(U).reshape(external_forces.shape)
+        return (U_full, stats) if return_stats else U_full
 
+    @timed('solve_newton')
     def solve_newton(self, external_forces: array, boundary_conditions: array,
-                     max_iters: int=1000, max_line_search_iters: int=20) -> array:
+                     max_iters: int=1000, max_line_search_iters: int=20, tol: float=1e-4,
+                     inexact: bool=False, forcing_max: float=0.9,
+                     line_search: str='residual', armijo_c: float=1e-4, U0: array=None,
+                     return_stats: bool=False) -> Union[array, Tuple[array, List[Dict]]]:
         '''
         Solve mesh deformation using Newton's method. Instead of solving K * U = f_ext, Newton's
         method iteratively solves the following equation:
@@ -296,36 +1063,84 @@ class StaticFEM:
         where Ui is the deformation matrix in the previous iteration, and f_el is the elastic forces
         in the previous iteration.
 
+        In `inexact` mode, the linear equation is only solved up to a relative tolerance (the
+        forcing term) that follows the decrease of the residual error, using the second choice of
+        Eisenstat and Walker:
+            `eta_k = 0.9 * (|f_res_k| / |f_res_(k-1)|) ^ 2`
+        safeguarded from dropping too fast and capped at `forcing_max`. The linear solver is also
+        warm-started from the previous Newton step.
+
+        The line search accepts a step size by one of two criteria (`line_search`):
+            * 'residual' - the norm of the residual forces decreases
+            * 'energy'   - the total potential energy `Pi(U) = E(V + U) - f_ext . U` decreases
+                sufficiently (the Armijo condition), where E is the total strain energy:
+                `Pi(Ui + l * dU) <= Pi(Ui) - armijo_c * l * f_res . dU`
+                Iterations where dU is not a descent direction of Pi (the stiffness matrix is
+                indefinite), or where no step size passes the Armijo condition, fall back to the
+                residual criterion.
+        The energy criterion only evaluates the strain energy of trial steps. The elastic forces
+        are computed at the accepted step, and the stiffness matrix only if the iteration has not
+        converged yet.
+
         Params:
             * `external_forces: array`     - (Nxd), external forces, N = #vertices, d = #dimensions
             * `boundary_conditions: array` - (N), a boolean mask array over the vertices. Those
                 masked by True are assumed to be fixed and excluded from the solver.
             * `max_iters: int`             - maximum iterations for the Newton's method
             * `max_line_search_iters: int` - maximum iterations of the line search algorithm
+            * `tol: float`                 - tolerance of the residual error for convergence
+            * `inexact: bool`              - whether to use the inexact Newton's method
+            * `forcing_max: float`         - upper bound of the forcing terms in inexact mode
+            * `line_search: str`           - the acceptance criterion of the line search,
+                'residual' or 'energy'
+            * `armijo_c: float`            - the sufficient decrease constant of the Armijo
+                condition in 'energy' line search
+            * `U0: array`                  - (Nxd), optional initial deformation matrix to start
+                from (zero by default). Its values at fixed vertices are ignored.
+            * `return_stats: bool`         - whether to also return the iteration statistics
 
         Return Value:
-            * `U: array` - (Nxd), deformation matrix
+            * `U: array`            - (Nxd), deformation matrix
+            * `stats: List[Dict]`   - statistics of each Newton iteration (optional), including
+                the residual error, the forcing term, the step size, the line search criterion
+                that accepted it, the number of line search iterations, and the linear solver
+                statistics
         '''
         # Check input validity
         assert max_iters >= 1 and max_line_search_iters >= 1, \
             'The iteration budgets must be at least 1'
+        assert line_search in ('residual', 'energy'), \
+            f"Unknown line search criterion '{line_search}', expected 'residual' or 'energy'"
 
         # Store class member data into local variables
         V = self.mesh.vertices     # (Nx3), N = #vertices
         dim = V.shape[1]           # d = #dimensions
 
         # Apply boundary conditions to external forces
-        active_mask = (~boundary_conditions).repeat(dim)    # The mask of unconstrained coordinates
-        active_indices = np.nonzero(active_mask)[0]         # Indices of unconstrained coordinates
-        f_ext = external_forces.ravel()[active_mask]        # The reduced external force vector
-
-        # Initialize the stiffness matrix
-        K_full = self.stiffness_matrix(V)
-        K = K_full[active_indices][:, active_indices]       # The reduced stiffness matrix
+        reduction = self.reduction(boundary_conditions)     # Elimination of fixed coordinates
+        f_ext = reduction.reduce(external_forces)           # The reduced external force vector
 
         # Initialize the elastic force matrix and the solution
         f_el = np.zeros_like(f_ext)
         Ui = np.zeros_like(f_ext)
+        V_i = V
+        stats = []
+
+        # Start from the initial deformation if given
+        if U0 is not None:
+            Ui[:] = reduction.reduce(U0)
+            V_i = V + reduction.expand(Ui)
+            f_el[:] = reduction.reduce(self.elastic_force(V_i))
+
+        # Initialize the reduced stiffness matrix
+        K = self.system_matrix(V_i, boundary_conditions)
+
+        # Initialize the forcing term, the previous residual error and step for inexact Newton
+        eta, f_res_prev_norm, step = 0.5, None, None
+
+        # Initialize the total potential energy at Ui for energy line search
+        if line_search == 'energy':
+            potential = self.strain_energy(V_i) - f_ext @ Ui
 
         # Our solver has a predefined budget of `max_iters` iterations
         for it in range(max_iters):
@@ -338,13 +1153,26 @@ class StaticFEM:
             # The update direction is dubbed as `dU`, where dU = U - Ui.
             # --------
             # TODO: Your code here. Compute f_res and dU.
-            # HINT: use the function `conjugate_gradient` to solve linear equations A * x = b.
-            # The usage is `x, stat = conjugate_gradient(A, b)`, where `stat` indicates the
-            # status of the CG solver.
+            # HINT: use the linear solver `self.solver` to solve linear equations A * x = b.
+            # The usage is `x, stat = self.linear_solve(A, b)`, which calls `self.solver.solve`
+            # and returns the statistics of the linear solver in `stat`.
             f_res = f_ext + f_el            # <--
-            dU, stat = conjugate_gradient(K, f_res)     # <--
-            if stat != 0:
-                print('Warning - CG solver failed with status', stat)
+            f_res_norm = np.linalg.norm(f_res)
+
+            # Choose the forcing term from the decrease of the residual error. The safeguards keep
+            # it from dropping abruptly after a single good step, and from solving the linear
+            # equation more accurately than the Newton tolerance requires.
+            if inexact and f_res_prev_norm is not None:
+                eta_prev = eta
+                eta = 0.9 * (f_res_norm / f_res_prev_norm) ** 2
+                if 0.9 * eta_prev ** 2 > 0.1:
+                    eta = max(eta, 0.9 * eta_prev ** 2)
+                eta = max(min(eta, forcing_max), 0.5 * tol / f_res_norm)
+
+            if inexact:
+                dU, stat = self.linear_solve(K, f_res, x0=step, tol=eta)
+            else:
+                dU, stat = self.linear_solve(K, f_res)     # <--
 
             # Perform line search to find a feasible step size for updating Ui
             #
@@ -355,69 +1183,259 @@ class StaticFEM:
             # We have given you the skeleton code of the line search algorithm, and now you will
             # fill in the blank lines according to the comments
 
-            # Initialize line search step size
-            l = 1.0
+            # The directional derivative of the potential energy along dU, where the gradient of
+            # the potential energy is -f_res
+            criteria = ['residual']
+            if line_search == 'energy':
+                slope = -f_res @ dU
+
+                # An indefinite stiffness matrix (e.g., a Neo-Hookean material under compression)
+                # can yield an uphill direction, where no step size decreases the energy. Such
+                # steps use the residual criterion. If the energy criterion accepts no step size,
+                # the residual criterion is tried next rather than taking a failed step.
+                if slope < 0:
+                    criteria = ['energy', 'residual']
+                else:
+                    self.instrumentation.count('line_search_fallbacks')
+            for criterion in criteria:
+
+                # Initialize line search step size
+                l = 1.0
+
+                # Line search algorithm loop
+                for line_search_iter in range(max_line_search_iters):
+                    self.instrumentation.count('line_search_trials')
+
+                    # Compute the current U using the step size l
+                    # --------
+                    # TODO: Your code here. Compute U.
+                    U = Ui + l * dU       # <--
+
+                    # Get the vertex coordinates `V_l` given the deformation matrix U
+                    V_l = V + reduction.expand(U)
+
+                    # Exit the loop if the potential energy decreases sufficiently. Inverted
+                    # elements yield a NaN energy, which fails the test and shrinks the step.
+                    if criterion == 'energy':
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            potential_l = self.strain_energy(V_l) - f_ext @ U
+                        if potential_l <= potential + armijo_c * l * slope:
+                            break
+
+                        # Halve the step size
+                        l *= 0.5
+                        continue
+
+                    # Computing the residual forces at U breaks down into two steps:
+                    #   1. Compute the reduced elastic forces f_el
+                    #   2. Compute f_res
+                    # --------
+                    # TODO: Your code here. Compute f_el.
+                    f_el_full = self.elastic_force(V_l)  # <--
+                    f_el[:] = reduction.reduce(f_el_full)
+
+                    # --------
+                    # TODO: Your code here. Compute f_res at step size l.
+                    f_res_l = f_ext + f_el      # <--
+
+                    # Exit the loop if `f_res_l` has a smaller norm than `f_res`
+                    # --------
+                    # TODO: Your code here. Implement the if-condition.
+                    # HINT:
+                    #   - The `np.linalg.norm` function computes the norm of a vector.
+                    #   - The norm of f_res has been precomputed and stored in `f_res_norm`
+                    f_res_l_norm = np.linalg.norm(f_res_l)      # <--
+                    if f_res_l_norm < f_res_norm:                # <--
+                        break
+
+                    # Halve the step size
+                    l *= 0.5
+
+                else:
+                    # Try the next criterion if the line search failed
+                    if criterion != criteria[-1]:
+                        self.instrumentation.count('line_search_fallbacks')
+                        continue
 
-            # Precompute the norm of `f_res` as the residual error
-            f_res_norm = np.linalg.norm(f_res)
+                break
 
-            # Line search algorithm loop
-            for _ in range(max_line_search_iters):
-
-                # Compute the current U using the step size l
-                # --------
-                # TODO: Your code here. Compute U.
-                U = Ui + l * dU       # <--
-
-                # Get the vertex coordinates `V_l` given the deformation matrix U
-                V_l = V.copy()
-                V_l.ravel()[active_mask] += U
-
-                # Computing the residual forces at U breaks down into two steps:
-                #   1. Compute the reduced elastic forces f_el
-                #   2. Compute f_res
-                # --------
-                # TODO: Your code here. Compute f_el.
-                f_el_full = self.elastic_force(V_l)  # <--
-                f_el[:] = f_el_full.ravel()[active_mask]
-
-                # --------
-                # TODO: Your code here. Compute f_res at step size l.
-                f_res_l = f_ext + f_el      # <--
-
-                # Exit the loop if `f_res_l` has a smaller norm than `f_res`
-                # --------
-                # TODO: Your code here. Implement the if-condition.
-                # HINT:
-                #   - The `np.linalg.norm` function computes the norm of a vector.
-                #   - The norm of f_res has been precomputed and stored in `f_res_norm`
-                f_res_l_norm = np.linalg.norm(f_res_l)      # <--
-                if f_res_l_norm < f_res_norm:                # <--
-                    break
-
-                # Halve the step size
-                l *= 0.5
+            # Compute the residual forces at the accepted step for energy line search. The
+            # stiffness matrix is only computed once the convergence check has failed.
+            if criterion == 'energy':
+                f_el[:] = reduction.reduce(self.elastic_force(V_l))
+                f_res_l_norm = np.linalg.norm(f_ext + f_el)
+                potential = potential_l
+            elif line_search == 'energy':
+                potential = self.strain_energy(V_l) - f_ext @ U
 
             # Print the residual error after line search
             print(f'Iteration {it + 1}: residual error = {f_res_l_norm}')
+            self.instrumentation.count('newton_iterations')
+            self.instrumentation.record('newton_residuals', f_res_l_norm)
+
+            # Record the iteration statistics
+            stats.append({
+                'iteration': it + 1,
+                'residual': f_res_l_norm,
+                'forcing': eta if inexact else self.solver.tol,
+                'step_size': l,
+                'line_search': criterion,
+                'line_search_iters': line_search_iter + 1,
+                'linear': stat,
+            })
 
             # Exit the loop if the residual error is sufficiently small
-            if f_res_l_norm < 1e-4:
+            if f_res_l_norm < tol:
                 print(f"Newton's method converged in {it + 1} iterations")
                 break
 
             # Update Ui using the U value after line search
+            step = U - Ui
             Ui[:] = U
+            f_res_prev_norm = f_res_norm
 
             # Update the reduced stiffness matrix at Ui
             # --------
             # TODO: Your code here.
             # HINT: You will need the deformed vertex positions to compute the stiffness matrix.
             # However, it's actually ready in an existing variable. Which one is it?
-            K_full = self.stiffness_matrix(V_l)   # <--
-            K = K_full[active_indices][:, active_indices]
+            K = self.system_matrix(V_l, boundary_conditions)   # <--
 
         # Obtain the full-size deformation matrix U
-        U_full = np.zeros_like(V)
-        U_full.ravel()[active_mask] = U
-        return U_full
+        U_full = reduction.expand(U)
+        return (U_full, stats) if return_stats else U_full
+
+    def problem_fingerprint(self, external_forces: array, boundary_conditions: array) -> str:
+        '''
+        Compute a hash that identifies the static problem, i.e., the rest vertex positions, the
+        elements, the material model and its parameters, the external forces and the boundary
+        conditions. Load stepping checkpoints are only resumed for the same fingerprint.
+        '''
+        h = hashlib.blake2b(digest_size=16)
+        for values in (self.mesh.vertices, self.mesh.elements, external_forces,
+                       boundary_conditions):
+            values = np.ascontiguousarray(values)
+            h.update(f'{values.dtype.str}{values.shape}'.encode())
+            h.update(values.tobytes())
+
+        # Material parameters
+        parameters = sorted((name, value) for name, value in vars(self.material).items()
+                            if isinstance(value, (int, float, str)))
+        h.update(f'{type(self.material).__name__}{parameters}'.encode())
+
+        return h.hexdigest()
+
+    @timed('solve_load_steps')
+    def solve_load_steps(self, external_forces: array, boundary_conditions: array,
+                         initial_step: float=1.0, min_step: float=1e-3, max_step: float=1.0,
+                         step_growth: float=1.5, step_shrink: float=0.5, fast_iters: int=5,
+                         max_iters: int=100, tol: float=1e-4, checkpoint_file: str='',
+                         return_stats: bool=False,
+                         **newton_options) -> Union[array, Tuple[array, List[Dict]]]:
+        '''
+        Solve mesh deformation under large loads by load stepping. The external forces are ramped
+        up from zero in increments of the load factor, and each load step is solved by Newton's
+        method starting from the solution of the previous step.
+
+        The increments are adaptive. A load step that fails to converge within `max_iters` Newton
+        iterations is retried with the increment scaled by `step_shrink`, and the solver gives up
+        once the increment drops below `min_step`. A load step that converges within `fast_iters`
+        iterations grows the next increment by `step_growth`, up to `max_step`. By default, the
+        first attempt is the full load with a budget of a typical full Newton solve, so loads
+        that Newton's method handles directly cost no more than a single solve.
+
+        If `checkpoint_file` is given, the state is saved to it (in npz format) after every
+        converged load step, and an existing checkpoint is resumed from if it belongs to the same
+        problem, i.e., the same mesh, material parameters, external forces and boundary
+        conditions (see `problem_fingerprint`). Checkpoints of other problems are ignored.
+
+        Params:
+            * `external_forces: array`     - (Nxd), external forces, N = #vertices, d = #dimensions
+            * `boundary_conditions: array` - (N), a boolean mask array over the vertices. Those
+                masked by True are assumed to be fixed and excluded from the solver.
+            * `initial_step: float`        - the initial increment of the load factor
+            * `min_step: float`            - the smallest increment before giving up
+            * `max_step: float`            - the largest increment
+            * `step_growth: float`         - the scale of the increment after fast convergence
+            * `step_shrink: float`         - the scale of the increment after a failed load step
+            * `fast_iters: int`            - the Newton iterations that count as fast convergence
+            * `max_iters: int`             - maximum Newton iterations of each load step
+            * `tol: float`                 - tolerance of the residual error for convergence
+            * `checkpoint_file: str`       - path to the checkpoint file (optional)
+            * `return_stats: bool`         - whether to also return the load step statistics
+            * `newton_options`             - other options of `solve_newton`
+
+        Return Value:
+            * `U: array`            - (Nxd), deformation matrix
+            * `stats: List[Dict]`   - statistics of each attempted load step (optional), including
+                the load factor, the increment, whether it converged, and the Newton statistics
+        '''
+        # Check input validity
+        assert 0 < min_step <= initial_step <= max_step <= 1, \
+            'The load increments must satisfy 0 < min_step <= initial_step <= max_step <= 1'
+        assert step_shrink < 1 <= step_growth, \
+            'The increment must shrink on failure and not shrink on fast convergence'
+
+        # Initialize the load factor, the increment and the solution
+        load, step = 0.0, initial_step
+        U = np.zeros_like(self.mesh.vertices)
+        stats = []
+
+        # Resume from the checkpoint of the same problem if it exists
+        fingerprint = self.problem_fingerprint(external_forces, boundary_conditions)
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            with np.load(checkpoint_file) as checkpoint:
+                if 'fingerprint' in checkpoint and str(checkpoint['fingerprint']) == fingerprint:
+                    load, step, U = float(checkpoint['load']), float(checkpoint['step']), \
+                        checkpoint['U']
+                    print(f"Resuming load stepping from load factor {load} in "
+                          f"'{checkpoint_file}'")
+                else:
+                    print(f"Ignoring the checkpoint '{checkpoint_file}' of a different problem, "
+                          f"starting from zero load")
+
+        # Ramp up the external forces until the full load is reached
+        while load < 1:
+            step = min(step, 1 - load)
+            target = min(load + step, 1.0)
+
+            # Solve the load step starting from the previous solution
+            U_step, newton_stats = self.solve_newton(
+                target * external_forces, boundary_conditions, max_iters=max_iters, tol=tol,
+                U0=U, return_stats=True, **newton_options)
+
+            residual = newton_stats[-1]['residual']
+            converged = bool(residual < tol)
+            stats.append({
+                'load': target,
+                'step': step,
+                'converged': converged,
+                'iterations': len(newton_stats),
+                'residual': residual,
+                'newton': newton_stats,
+            })
+            print(f'Load step to {target:.4f}: {"converged" if converged else "failed"} after '
+                  f'{len(newton_stats)} iterations')
+
+            # Shrink the increment and retry if the load step fails
+            if not converged:
+                step *= step_shrink
+                if step < min_step:
+                    raise RuntimeError(f'Load stepping failed at load factor {load}, the '
+                                       f'increment dropped below {min_step}')
+                continue
+
+            # Accept the load step and grow the increment after fast convergence
+            load, U = target, U_step
+            if len(newton_stats) <= fast_iters:
+                step = min(step * step_growth, max_step)
+
+            # Save the state to the checkpoint file. Writing to a temporary file first keeps the
+            # previous checkpoint intact if the process is interrupted.
+            if checkpoint_file:
+                temp_file = f'{checkpoint_file}.tmp'
+                with open(temp_file, 'wb') as f:
+                    np.savez(f, load=load, step=step, U=U, fingerprint=fingerprint)
+                os.replace(temp_file, checkpoint_file)
+
+        return (U, stats) if return_stats else U
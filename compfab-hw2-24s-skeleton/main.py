@@ -1,6 +1,7 @@
 from tet_mesh import TetMesh, tet_mesh_cuboid, tet_mesh_from_file
 from material import Material, LinearElastic, NeoHookean
 from fem import StaticFEM
+from system_io import save_system
 
 from numpy import ndarray as array
 from typing import Tuple
@@ -54,7 +55,11 @@ def boundary_conditions(vertices: array, external_force: array,
     return f_ext, bc
 
 
-def test_fem(mesh: TetMesh, material: Material, external_force: array, name: str):
+def test_fem(mesh: TetMesh, material: Material, external_force: array, name: str,
+             solver: str='cg', preconditioner: str=None, matrix_free: bool=False,
+             inexact: bool=False, line_search: str='residual', compact: bool=False,
+             dtype: type=np.float64, load_steps: bool=False, checkpoint: bool=False,
+             profile: bool=False, fields: bool=False):
     '''
     Default FEM test function.
     '''
@@ -73,31 +78,45 @@ def test_fem(mesh: TetMesh, material: Material, external_force: array, name: str
     f_ext, bc = boundary_conditions(V, external_force, tolerance=cube_size * 0.5)
 
     # Create the FEM solver
-    fem = StaticFEM(mesh, material)
+    fem = StaticFEM(mesh, material, solver=solver, preconditioner=preconditioner,
+                    matrix_free=matrix_free, compact=compact, dtype=dtype, instrument=profile)
 
     # Compute the deformation
     if material.type == 'linear':
-        U = fem.solve_linear(f_ext, bc)
+        U, stats = fem.solve_linear(f_ext, bc, return_stats=True)
+    elif material.type == 'nonlinear' and load_steps:
+        checkpoint_file = os.path.join(result_dir, f'checkpoint_{material.type}.npz') \
+            if checkpoint else ''
+        U, step_stats = fem.solve_load_steps(f_ext, bc, checkpoint_file=checkpoint_file,
+                                             inexact=inexact, line_search=line_search,
+                                             return_stats=True)
+        stats = [s['linear'] for step in step_stats for s in step['newton']]
     elif material.type == 'nonlinear':
-        U = fem.solve_newton(f_ext, bc)
+        U, newton_stats = fem.solve_newton(f_ext, bc, inexact=inexact,
+                                             line_search=line_search, return_stats=True)
+        stats = [s['linear'] for s in newton_stats]
     else:
         raise ValueError('Unknown material model type')
 
-    # Save the stiffness matrix for the linear material model (for case 4x2x2 only)
-    if V.shape[0] <= 16:
-        # Get the stiffness matrix
-        K_full = fem.stiffness_matrix(V)
-        active_indices = np.nonzero((~bc).repeat(V.shape[1]))[0]
-        K = K_full[active_indices][:, active_indices]
+    print(f"Linear solver '{fem.solver.name}': {len(stats)} solves, "
+          f"{sum(s['iterations'] for s in stats)} iterations, "
+          f"{sum(s['time'] for s in stats):.3f} s")
+
+    # Report and save the instrumentation data
+    if profile:
+        profile_file_name = os.path.join(result_dir, f'profile_{material.type}.json')
+        fem.instrumentation.to_json(profile_file_name)
+        print(fem.instrumentation.summary())
+        print(f"Profile saved to '{profile_file_name}'")
 
-        # Write the stiffness matrix into an external file
-        stiffness_matrix_file_name = os.path.join(result_dir, f'K_{name}_{material.type}.txt')
-        with open(stiffness_matrix_file_name, 'w') as f:
-            for row in K.toarray():
-                row_str = ' '.join([f'{v:.6f}' for v in row])
-                f.write(f'{row_str}\n')
+    # Save the reduced stiffness matrix with the external forces, the boundary conditions and
+    # the solution in compressed sparse format (see `system_io.load_system`)
+    if not matrix_free:
+        K = fem.stiffness_matrix(V, bc)
+        system_file_name = os.path.join(result_dir, f'K_{name}_{material.type}.npz')
+        save_system(system_file_name, K, f_ext=f_ext, bc=bc, U=U)
 
-        print(f"Stiffness matrix saved to '{stiffness_matrix_file_name}'")
+        print(f"Stiffness matrix saved to '{system_file_name}'")
 
     # Construct and save the deformed mesh
     mesh_deform = TetMesh(V + U, mesh.elements)
@@ -106,6 +125,23 @@ def test_fem(mesh: TetMesh, material: Material, external_force: array, name: str
 
     print(f"Deformed mesh saved to '{output_mesh_file_name}'")
 
+    # Save the strain and stress fields on the deformed mesh
+    if fields:
+        element_fields = fem.element_fields(V + U)
+        vertex_fields = fem.vertex_fields({name: element_fields[name]
+                                           for name in ('equivalent_strain', 'von_mises',
+                                                        'energy_density')})
+        fields_file_name = os.path.join(result_dir, f'fields_{material.type}.vtk')
+        mesh_deform.write_vtk(
+            fields_file_name, point_data={'displacement': U, **vertex_fields},
+            cell_data={name: element_fields[name]
+                       for name in ('strain', 'equivalent_strain', 'cauchy', 'von_mises',
+                                    'energy_density')})
+
+        print(f"Max von Mises stress: {element_fields['von_mises'].max():.6g}")
+        print(f"Max equivalent strain: {element_fields['equivalent_strain'].max():.6g}")
+        print(f"Strain and stress fields saved to '{fields_file_name}'")
+
 
 def boundary_conditions_custom(vertices: array, tolerance: float=1e-8) -> Tuple[array, array]:
     '''
@@ -205,13 +241,55 @@ def main():
                         help='Dimensions of the cuboid for testing (e.g. 4x2x2)')
     parser.add_argument('-f', '--test-force', default='0,0,-50',
                         help='The external force for testing (e.g., 0,0,-50)')
+    parser.add_argument('-s', '--solver', default='cg', choices=['cg', 'pcg', 'direct'],
+                        help='The linear solver backend')
+    parser.add_argument('-p', '--preconditioner', default=None,
+                        choices=['jacobi', 'block_jacobi', 'ilu'],
+                        help='The preconditioner of CG solvers')
+    parser.add_argument('--matrix-free', action='store_true',
+                        help='Solve without assembling the stiffness matrix')
+    parser.add_argument('--inexact', action='store_true',
+                        help="Use the inexact Newton's method for nonlinear materials")
+    parser.add_argument('--line-search', default='residual', choices=['residual', 'energy'],
+                        help="The acceptance criterion of the line search in Newton's method")
+    parser.add_argument('--compact', action='store_true',
+                        help='Store only Dm^(-1) and volumes per tet element (no dense dF/dx)')
+    parser.add_argument('--float32', action='store_true',
+                        help='Store per-tet precomputed values in single precision')
+    parser.add_argument('--load-steps', action='store_true',
+                        help='Ramp up the external forces over adaptive load steps for nonlinear '
+                             'materials')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='Save (and resume from) load stepping checkpoints in the result '
+                             'folder')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record timings and counters of the FEM solver and save them in the '
+                             'result folder')
+    parser.add_argument('--fields', action='store_true',
+                        help='Save the per-element and vertex-averaged strain and stress fields of '
+                             'the solution in VTK format')
 
     # Process arguments
     args = parser.parse_args()
+    if args.matrix_free and (args.solver != 'cg' or args.preconditioner is not None):
+        parser.error('--matrix-free only supports the unpreconditioned CG solver (-s cg)')
+    if args.solver == 'direct' and args.preconditioner is not None:
+        parser.error('The direct solver (-s direct) takes no preconditioner (-p)')
 
     mesh_name = args.mesh
     test_cuboid_size = args.test_cuboid_size
     test_force = np.array([int(c) for c in args.test_force.split(',')])
+    solver = args.solver
+    preconditioner = args.preconditioner
+    matrix_free = args.matrix_free
+    inexact = args.inexact
+    line_search = args.line_search
+    compact = args.compact
+    dtype = np.float32 if args.float32 else np.float64
+    load_steps = args.load_steps
+    checkpoint = args.checkpoint
+    profile = args.profile
+    fields = args.fields
 
     # Material models
     linear_material = LinearElastic(E, nu)
@@ -239,7 +317,9 @@ def main():
 
         # Test both linear and non-linear materials
         for material in (linear_material, neohookean_material):
-            test_fem(tet_mesh, material, test_force, test_cuboid_size)
+            test_fem(tet_mesh, material, test_force, test_cuboid_size, solver, preconditioner,
+                     matrix_free, inexact, line_search, compact, dtype, load_steps,
+                     checkpoint, profile, fields)
 
     # Perform default testing with cuboids
     else:
@@ -254,7 +334,9 @@ def main():
 
                 # Test deformation using the cuboid mesh
                 test_name = f'{nx}x{ny}x{nz}'
-                test_fem(tet_mesh, material, test_force, test_name)
+                test_fem(tet_mesh, material, test_force, test_name, solver, preconditioner,
+                         matrix_free, inexact, line_search, compact, dtype,
+                         load_steps, checkpoint, profile, fields)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+from tet_mesh import TetMesh, TET_FACES
+
+from numpy import ndarray as array
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+# Elements whose volume is below this fraction of the volume of a regular tet with the same
+# longest edge are considered degenerate
+DEGENERATE_TOLERANCE = 1e-6
+
+
+def normalized_volumes(vertices: array, elements: array) -> Tuple[array, array]:
+    '''
+    Compute the signed volumes of tet elements, i.e., det([x2 - x1, x3 - x1, x4 - x1]) / 6, and
+    their normalized counterparts relative to a regular tet with the same longest edge, which
+    lie in [-1, 1].
+
+    Return values:
+        * `volume: array`             - (M) signed volumes
+        * `normalized_volume: array`  - (M) normalized signed volumes
+    '''
+    P = vertices[elements]
+    return normalized_volumes_from_bases((P[:, 1:] - P[:, [0]]).transpose(0, 2, 1))
+
+
+def normalized_volumes_from_bases(D: array) -> Tuple[array, array]:
+    '''
+    Compute the signed and normalized volumes of tet elements from their edge matrices, e.g.,
+    the rest-shape bases Dm = [X2 - X1, X3 - X1, X4 - X1] of the FEM solver.
+
+    Params:
+        * `D: array` - (Mx3x3) edge matrices whose columns are the edges from the first vertex
+
+    Return values:
+        * `volume: array`             - (M) signed volumes
+        * `normalized_volume: array`  - (M) normalized signed volumes
+    '''
+    volume = np.einsum('ti,ti->t', D[:, :, 0], np.cross(D[:, :, 1], D[:, :, 2])) * (1 / 6)
+
+    # The other three edges are the differences between the columns of D. A regular tet with
+    # edge length l has a volume of l^3 / (6 * sqrt(2))
+    edges = np.concatenate((D, D[:, :, [1, 2, 2]] - D[:, :, [0, 0, 1]]), axis=2)
+    max_edge = np.sqrt(np.einsum('tij,tij->tj', edges, edges).max(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized_volume = volume * (6 * np.sqrt(2)) / max_edge ** 3
+
+    return volume, np.nan_to_num(normalized_volume)
+
+
+def tet_quality(mesh: TetMesh) -> Dict[str, array]:
+    '''
+    Compute quality metrics of all tet elements. All metrics are scale-invariant, and all but
+    the volume equal 1 for a regular tet (or 70.53 degrees for the dihedral angle).
+
+    Return value:
+        * `quality: Dict[str, array]` - per-element metrics, each a (M) array, M = #elements:
+            * `volume` - signed volumes
+            * `normalized_volume` - volumes relative to a regular tet with the same longest
+                edge, in [-1, 1]
+            * `aspect_ratio` - longest edge over the inradius, normalized by 2 * sqrt(6).
+                Degenerate elements have infinite aspect ratios.
+            * `min_dihedral` - smallest dihedral angle in degrees
+            * `radius_ratio` - 3 * inradius / circumradius, in [0, 1]
+    '''
+    P = mesh.vertices[mesh.elements]
+
+    # Signed volumes
+    volume, normalized_volume = normalized_volumes(mesh.vertices, mesh.elements)
+    abs_volume = np.abs(volume)
+
+    # Edge vectors from the first vertex and the longest edge
+    a, b, c = P[:, 1] - P[:, 0], P[:, 2] - P[:, 0], P[:, 3] - P[:, 0]
+    edges = np.stack((a, b, c, b - a, c - a, c - b), axis=1)
+    max_edge = np.linalg.norm(edges, axis=2).max(axis=1)
+
+    # Area vectors of the faces, which are consistently oriented
+    N = np.cross(P[:, TET_FACES[:, 1]] - P[:, TET_FACES[:, 0]],
+                 P[:, TET_FACES[:, 2]] - P[:, TET_FACES[:, 0]]) * 0.5
+    areas = np.linalg.norm(N, axis=2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Inradius r = 3V / A, where A is the total surface area
+        inradius = 3 * abs_volume / areas.sum(axis=1)
+
+        # Circumradius R = |(|a|^2 (b x c) + |b|^2 (c x a) + |c|^2 (a x b))| / (12V)
+        sq = lambda v: np.einsum('ti,ti->t', v, v)[:, None]
+        circum = sq(a) * np.cross(b, c) + sq(b) * np.cross(c, a) + sq(c) * np.cross(a, b)
+        circumradius = np.linalg.norm(circum, axis=1) / (12 * abs_volume)
+
+        # Every pair of faces meets at one edge, where the dihedral angle is the supplement of
+        # the angle between their (outward or inward) normals
+        i, j = np.triu_indices(4, k=1)
+        cos = np.einsum('tki,tki->tk', N[:, i], N[:, j]) / (areas[:, i] * areas[:, j])
+        min_dihedral = np.degrees(np.pi - np.arccos(np.clip(cos, -1, 1))).min(axis=1)
+
+        quality = {
+            'volume': volume,
+            'normalized_volume': normalized_volume,
+            'aspect_ratio': max_edge / inradius / (2 * np.sqrt(6)),
+            'min_dihedral': np.nan_to_num(min_dihedral),
+            'radius_ratio': np.nan_to_num(3 * inradius / circumradius),
+        }
+
+    return quality
+
+
+def bad_elements(mesh: TetMesh, tolerance: float=DEGENERATE_TOLERANCE) -> Tuple[array, array]:
+    '''
+    Flag inverted and degenerate tet elements.
+
+    Meshes follow no fixed orientation convention (e.g., cuboid meshes have negative signed
+    volumes), so an element is inverted if the sign of its volume differs from that of the total
+    signed volume of the mesh. An element is degenerate if its absolute normalized volume (see
+    `tet_quality`) is below `tolerance`. Degenerate elements are not flagged as inverted.
+
+    Return values:
+        * `inverted: array`   - (M) boolean mask of inverted elements
+        * `degenerate: array` - (M) boolean mask of degenerate elements
+    '''
+    volume, normalized_volume = normalized_volumes(mesh.vertices, mesh.elements)
+
+    degenerate = np.abs(normalized_volume) < tolerance
+    orientation = 1 if volume.sum() >= 0 else -1
+    inverted = (volume * orientation < 0) & ~degenerate
+    return inverted, degenerate
+
+
+def repair_elements(mesh: TetMesh, action: str='fix',
+                    tolerance: float=DEGENERATE_TOLERANCE) -> Tuple[TetMesh, array]:
+    '''
+    Remove or repair the inverted and degenerate tet elements of a mesh (see `bad_elements`).
+    Supported actions are:
+        * 'drop' - remove inverted and degenerate elements
+        * 'fix'  - flip inverted elements to the orientation of the mesh by swapping two of
+            their vertices, and remove degenerate elements, which cannot be repaired
+
+    Vertices are kept as is, so vertices referenced only by removed elements become unused.
+
+    Return values:
+        * `mesh: TetMesh`         - the repaired tet mesh
+        * `element_order: array`  - (M'), the new element i is the old element element_order[i]
+    '''
+    inverted, degenerate = bad_elements(mesh, tolerance)
+    T = mesh.elements
+
+    if action == 'drop':
+        keep = ~(inverted | degenerate)
+    elif action == 'fix':
+        keep = ~degenerate
+        T = T.copy()
+        T[inverted] = T[inverted][:, [0, 1, 3, 2]]
+    else:
+        raise ValueError(f"Unknown repair action '{action}', expected 'drop' or 'fix'")
+
+    element_order = np.nonzero(keep)[0]
+    return TetMesh(mesh.vertices, T[element_order]), element_order
+
+
+def quality_summary(mesh: TetMesh, bins: int=10, width: int=40,
+                    tolerance: float=DEGENERATE_TOLERANCE) -> str:
+    '''
+    Format the quality metrics of a tet mesh as a human-readable report, with the number of
+    inverted and degenerate elements and a text histogram of each metric.
+    '''
+    quality = tet_quality(mesh)
+    inverted, degenerate = bad_elements(mesh, tolerance)
+
+    lines = [f'{mesh.elements.shape[0]} elements, {inverted.sum()} inverted, '
+             f'{degenerate.sum()} degenerate']
+
+    # Histograms over the fixed ranges of the metrics. Aspect ratios are unbounded, so they are
+    # binned on a log scale and the last bin also collects larger values.
+    ranges = {
+        'aspect_ratio': (0, 3),
+        'min_dihedral': (0, 70.53),
+        'radius_ratio': (0, 1),
+    }
+    for name, (lo, hi) in ranges.items():
+        values = quality[name][~degenerate]
+        if not values.size:
+            continue
+
+        lines.append('')
+        lines.append(f'{name}: min {values.min():.4g}, median {np.median(values):.4g}, '
+                     f'max {values.max():.4g}' + (' (log10 bins)' if name == 'aspect_ratio'
+                                                  else ''))
+
+        if name == 'aspect_ratio':
+            values = np.log10(values)
+        counts, edges = np.histogram(np.clip(values, lo, hi), bins=bins, range=(lo, hi))
+
+        scale = width / max(counts.max(), 1)
+        for count, left, right in zip(counts, edges[:-1], edges[1:]):
+            lines.append(f'  [{left:>7.3f}, {right:>7.3f}) {count:>9} '
+                         f'{"#" * int(np.ceil(count * scale))}')
+
+    return '\n'.join(lines)
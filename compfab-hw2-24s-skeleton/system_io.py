@@ -0,0 +1,79 @@
+from numpy import ndarray as array
+from scipy.io import mmread, mmwrite
+from scipy.sparse import csc_matrix, spmatrix
+from typing import Dict
+
+import os
+import numpy as np
+
+
+# Optional arrays stored alongside the stiffness matrix
+SYSTEM_ARRAYS = ('f_ext', 'bc', 'U')
+
+
+def save_system(file_name: str, K: spmatrix, f_ext: array=None, bc: array=None,
+                U: array=None):
+    '''
+    Save a sparse stiffness matrix and optionally the external forces, the boundary condition
+    mask and the solution of an FEM system in binary sparse format, without ever forming the
+    dense matrix. The format follows the file extension:
+        * '.npz' - one compressed NumPy archive with the CSC arrays of K and the other arrays
+        * '.mtx' - Matrix Market for interchange with other tools. K is written to `file_name`
+            and every other array to a sidecar file, e.g., 'K_f_ext.mtx' next to 'K.mtx'.
+
+    Params:
+        * `file_name: str` - path to the output file
+        * `K: spmatrix`    - (MxM) sparse stiffness matrix, full or reduced
+        * `f_ext: array`   - (Nxd) external forces (optional)
+        * `bc: array`      - (N) boundary condition mask (optional)
+        * `U: array`       - (Nxd) deformation matrix (optional)
+    '''
+    K = csc_matrix(K)
+    arrays = {name: np.asarray(value) for name, value in zip(SYSTEM_ARRAYS, (f_ext, bc, U))
+              if value is not None}
+
+    if file_name.endswith('.mtx'):
+        stem = file_name[:-len('.mtx')]
+        mmwrite(file_name, K, symmetry='general')
+        for name, value in arrays.items():
+            value = value.astype(np.int8) if value.dtype == bool else value
+            mmwrite(f'{stem}_{name}.mtx', value.reshape(value.shape[0], -1))
+
+    elif file_name.endswith('.npz'):
+        np.savez_compressed(file_name, K_data=K.data, K_indices=K.indices, K_indptr=K.indptr,
+                            K_shape=np.array(K.shape), **arrays)
+
+    else:
+        raise ValueError(f"Unknown file format of '{file_name}', expected '.npz' or '.mtx'")
+
+
+def load_system(file_name: str) -> Dict[str, array]:
+    '''
+    Load an FEM system saved by `save_system`.
+
+    Return value:
+        * `system: Dict[str, array]` - the stiffness matrix `K` (CSC format) and those of
+            `f_ext`, `bc` and `U` that were saved
+    '''
+    system = {}
+
+    if file_name.endswith('.mtx'):
+        stem = file_name[:-len('.mtx')]
+        system['K'] = csc_matrix(mmread(file_name))
+        for name in SYSTEM_ARRAYS:
+            if os.path.exists(f'{stem}_{name}.mtx'):
+                value = np.asarray(mmread(f'{stem}_{name}.mtx'))
+                system[name] = value.ravel().astype(bool) if name == 'bc' else value
+
+    elif file_name.endswith('.npz'):
+        with np.load(file_name) as data:
+            system['K'] = csc_matrix((data['K_data'], data['K_indices'], data['K_indptr']),
+                                     shape=tuple(data['K_shape']))
+            for name in SYSTEM_ARRAYS:
+                if name in data:
+                    system[name] = data[name]
+
+    else:
+        raise ValueError(f"Unknown file format of '{file_name}', expected '.npz' or '.mtx'")
+
+    return system
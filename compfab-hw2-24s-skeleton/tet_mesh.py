@@ -1,8 +1,14 @@
 from numpy import ndarray as array
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, reverse_cuthill_mckee
 
-from typing import BinaryIO
+from functools import wraps
+from typing import BinaryIO, Callable, Dict, Tuple
 
+import os
+import json
 import struct
+import hashlib
 import numpy as np
 
 
@@ -21,9 +27,224 @@ def read_array_from_file(f: BinaryIO, dtype: np.dtype, dim: int=2) -> array:
     return arr.reshape(*shape)
 
 
+def memmap_array_from_file(file_name: str, offset: int, dtype: np.dtype,
+                           dim: int=2) -> Tuple[array, int]:
+    '''
+    Memory-map a Numpy array stored at byte `offset` of the input file in the format of
+    `read_array_from_file`. The array is read-only and its pages are loaded on demand.
+
+    Return values:
+        * `arr: array`       - the memory-mapped array
+        * `end_offset: int`  - byte offset of the end of the array in the file
+    '''
+    assert dim <= 2, 'Only support up to 2D matrices'
+
+    # Read matrix shape
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        shape = struct.unpack('q' * dim, f.read(8 * dim))
+
+    # Map matrix content
+    offset += 8 * dim
+    arr = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return np.asarray(arr), offset + dtype.itemsize * int(np.prod(shape))
+
+
+def file_fingerprint(file_name: str, block_size: int=1 << 16, num_blocks: int=16) -> str:
+    '''
+    Compute a hash of a file from `num_blocks` blocks of `block_size` bytes evenly spaced over
+    the file (including the first and last blocks) and the file size, which takes constant time
+    even for multi-GB files.
+    '''
+    file_size = os.path.getsize(file_name)
+    h = hashlib.blake2b(struct.pack('q', file_size), digest_size=16)
+
+    with open(file_name, 'rb') as f:
+        for offset in np.linspace(0, max(file_size - block_size, 0), num_blocks).astype(np.int64):
+            f.seek(int(offset))
+            h.update(f.read(block_size))
+
+    return h.hexdigest()
+
+
+def morton_codes(points: array, bits: int=21) -> array:
+    '''
+    Compute the Morton (Z-order) codes of (Nx3) points. The coordinates are quantized to `bits`
+    bits (at most 21) within the bounding box of the points, and the bits of the three axes are
+    interleaved into a 64-bit code.
+    '''
+    assert bits <= 21, 'Morton codes support up to 21 bits per axis'
+
+    # Quantize the coordinates into integers within the bounding box
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scale = ((1 << bits) - 1) / np.maximum(hi - lo, np.finfo(np.float64).tiny)
+    q = ((points - lo) * scale).astype(np.uint64)
+
+    # Spread the bits of each coordinate so that two zero bits follow every bit
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f),
+                        (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+        q = (q | (q << np.uint64(shift))) & np.uint64(mask)
+
+    # Interleave the three axes
+    return q[:, 0] | (q[:, 1] << np.uint64(1)) | (q[:, 2] << np.uint64(2))
+
+
+def weld_labels(points: array, tolerance: float) -> array:
+    '''
+    Group (Nx3) points that lie within `tolerance` of each other, including chains of such
+    points. A `tolerance` of 0 groups exactly coincident points.
+
+    Exactly coincident points are grouped first by sorting, so that clusters of duplicates (e.g.,
+    the vertices of a tet soup) do not produce quadratically many candidate pairs. The remaining
+    points are bucketed into a spatial hash of cubic cells with an edge length of `tolerance`,
+    so that candidate pairs only come from the same or adjacent cells. The cell keys are sorted
+    once and neighboring cells are looked up by binary search, which takes O(N log N) time.
+    Keys are linear cell indices unless the grid is too large, where hash collisions only add
+    candidates that are removed by the exact distance check.
+
+    Return value:
+        * `labels: array` - (N) group index of each point. Group indices are numbered in the
+            order of the first point in each group.
+    '''
+    num_points = points.shape[0]
+
+    # Group exactly coincident points by sorting the bit patterns of their coordinates (after
+    # turning -0.0 into 0.0)
+    bits = np.ascontiguousarray(points + 0.0, dtype=np.float64).view(np.int64)
+    order = np.lexsort(bits.T[::-1])
+    is_new = np.ones(num_points, dtype=bool)
+    is_new[1:] = (bits[order[1:]] != bits[order[:-1]]).any(axis=1)
+
+    labels = np.empty(num_points, dtype=np.int64)
+    labels[order] = np.cumsum(is_new) - 1
+    unique_points = points[order[is_new]]
+
+    # Weld the distinct points within tolerance
+    if tolerance > 0 and unique_points.shape[0] > 1:
+        labels = hash_weld(unique_points, tolerance)[labels]
+
+    # Renumber the groups in the order of their first points
+    first = np.full(labels.max(initial=-1) + 1, num_points)
+    np.minimum.at(first, labels, np.arange(num_points))
+    rank = np.empty_like(first)
+    rank[np.argsort(first)] = np.arange(first.size)
+    return rank[labels]
+
+
+def hash_weld(points: array, tolerance: float) -> array:
+    '''
+    Label the connected components of (Nx3) distinct points under the relation of lying within
+    `tolerance` of each other, using a spatial hash (see `weld_labels`).
+    '''
+    num_points = points.shape[0]
+
+    # Compute the integer cell coordinates of points, padded by one cell on each side. Cells may
+    # be larger than the tolerance to keep the coordinates within 64-bit integers.
+    extent = points.max(axis=0) - points.min(axis=0)
+    cell_size = max(tolerance, extent.max() * 2.0 ** -40)
+    cells = np.floor((points - points.min(axis=0)) / cell_size).astype(np.int64) + 1
+    dims = [int(d) + 2 for d in cells.max(axis=0)]
+
+    # Cells are keyed by their linear indices, where a neighbor cell is a constant offset away.
+    # The keys of neighbor cells are then sorted too, which makes their lookup cache-friendly. If
+    # the grid is too large for 64-bit indices, the cell coordinates are hashed instead.
+    linear = dims[0] * dims[1] * dims[2] < 2 ** 63
+    if linear:
+        strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+        cell_keys = lambda cells: cells @ strides
+    else:
+        def cell_keys(cells: array) -> array:
+            # Mix the cell coordinates into 64-bit keys (wrapping around on overflow)
+            c = cells.astype(np.uint64)
+            return (c[:, 0] * np.uint64(0x9e3779b97f4a7c15)) ^ \
+                (c[:, 1] * np.uint64(0xc2b2ae3d27d4eb4f)) ^ \
+                (c[:, 2] * np.uint64(0x165667b19e3779f9))
+
+    # Sort the points by key, and find the occupied cells and their ranges in the sorted order
+    keys = cell_keys(cells)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    is_first = np.ones(num_points, dtype=bool)
+    is_first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    cell_keys_unique = sorted_keys[is_first]
+    cell_start = np.nonzero(is_first)[0]
+    cell_count = np.diff(np.append(cell_start, num_points))
+    cell_of_point = np.cumsum(is_first) - 1
+
+    # Collect candidate pairs from each cell and half of its 26 neighbors, so that every pair of
+    # adjacent cells is visited once
+    offsets = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)
+               if (i, j, k) >= (0, 0, 0)]
+    cell_coords = cells[order[cell_start]]
+
+    rows, cols = [], []
+    for offset in offsets:
+        # Look up the neighbor cell of every occupied cell
+        if offset == (0, 0, 0):
+            neighbor = np.arange(cell_start.size)
+        else:
+            neighbor_keys = cell_keys(cell_coords + np.array(offset))
+            neighbor = np.searchsorted(cell_keys_unique, neighbor_keys)
+            neighbor[neighbor == cell_start.size] = 0
+            neighbor[cell_keys_unique[neighbor] != neighbor_keys] = -1
+
+        # Pair every point (in sorted order) with all points in the neighbor cell of its cell
+        neighbor = neighbor[cell_of_point]
+        counts = np.where(neighbor >= 0, cell_count[neighbor], 0)
+        start = cell_start[neighbor]
+        i = np.repeat(np.arange(num_points), counts)
+        j = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(i.size)
+        if offset == (0, 0, 0):
+            i, j = i[i < j], j[i < j]
+        i, j = order[i], order[j]
+
+        # Keep the pairs within tolerance
+        d = points[i] - points[j]
+        keep = np.einsum('ti,ti->t', d, d) <= tolerance ** 2
+        rows.append(i[keep])
+        cols.append(j[keep])
+
+    # Label the connected components of the pair graph
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = csr_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols)),
+                       shape=(num_points, num_points))
+    return connected_components(graph, directed=False)[1]
+
+
+# Vertex indices of the four triangles of a tet element
+TET_FACES = np.array([[0, 1, 2], [1, 3, 2], [1, 0, 3], [0, 2, 3]])
+
+# Vertex indices of the six edges of a tet element
+TET_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+
+# Record of a triangle in binary STL files
+STL_RECORD = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def cached(method: Callable) -> Callable:
+    '''
+    Decorator that computes a connectivity structure of a tet mesh on the first call and returns
+    the cached result afterwards. The cache is cleared when the vertices or elements of the mesh
+    are replaced.
+    '''
+    @wraps(method)
+    def wrapper(self):
+        cache = self.adjacency_cache
+        if method.__name__ not in cache:
+            cache[method.__name__] = method(self)
+        return cache[method.__name__]
+    return wrapper
+
+
 class TetMesh:
     '''
     Class of a tetrahedral mesh.
+
+    Connectivity structures (`vertex_adjacency`, `vertex_elements`, `faces`, `face_neighbors`,
+    `edges` and `boundary_faces`) are computed lazily and cached. Replacing the vertex or element
+    array, e.g., `mesh.V = V_new`, clears the cache, but modifying the arrays in place does not.
+    Cached results are shared across calls and must not be modified.
     '''
     def __init__(self, vertices: array, elements: array):
         # Check the shape of vertex and element arrays
@@ -36,6 +257,12 @@ class TetMesh:
         self.V = vertices
         self.T = elements
 
+    def __setattr__(self, name: str, value: object):
+        # Replacing the vertices or elements invalidates the cached connectivity structures
+        if name in ('V', 'T'):
+            super().__setattr__('adjacency_cache', {})
+        super().__setattr__(name, value)
+
     @property
     def vertices(self) -> array:
         '''
@@ -43,6 +270,10 @@ class TetMesh:
         '''
         return self.V
 
+    @vertices.setter
+    def vertices(self, vertices: array):
+        self.V = vertices
+
     @property
     def elements(self) -> array:
         '''
@@ -50,43 +281,312 @@ class TetMesh:
         '''
         return self.T
 
-    def write_to_file(self, file_name: str, invert_normal: bool=False):
+    @elements.setter
+    def elements(self, elements: array):
+        self.T = elements
+
+    @cached
+    def vertex_adjacency(self) -> csr_matrix:
+        '''
+        Return the (NxN) sparse vertex adjacency matrix of the tet mesh, where two vertices are
+        adjacent if they share a tet element.
+        '''
+        T, num_vertices = self.T, self.V.shape[0]
+
+        # Connect every pair of vertices in each tet element
+        rows = np.repeat(T, T.shape[1], axis=1).ravel()
+        cols = np.tile(T, (1, T.shape[1])).ravel()
+        adjacency = csr_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols)),
+                               shape=(num_vertices, num_vertices))
+        adjacency.sum_duplicates()
+        return adjacency
+
+    def reorder(self, method: str='rcm') -> Tuple['TetMesh', array, array]:
+        '''
+        Reorder the vertices and elements of the tet mesh to improve memory locality. Supported
+        methods are:
+            * 'rcm'    - reverse Cuthill-McKee ordering of the vertex adjacency graph, which
+                reduces the bandwidth of the stiffness matrix. Elements are sorted by their
+                smallest vertex index.
+            * 'morton' - Morton (Z-order) space-filling curve ordering of vertex positions.
+                Elements are sorted by the Morton codes of their centroids.
+
+        Return values:
+            * `mesh: TetMesh`           - the reordered tet mesh
+            * `vertex_order: array`     - (N), the new vertex i is the old vertex vertex_order[i]
+            * `element_order: array`    - (M), the new element i is the old element
+                element_order[i]
+
+        Per-vertex results on the reordered mesh are mapped back by indexing, e.g.,
+        `U[vertex_order] = U_reordered` for an empty (Nx3) array U.
+        '''
+        V, T = self.V, self.T
+
+        # Compute the vertex order
+        if method == 'rcm':
+            vertex_order = reverse_cuthill_mckee(self.vertex_adjacency(), symmetric_mode=True)
+        elif method == 'morton':
+            vertex_order = np.argsort(morton_codes(V), kind='stable')
+        else:
+            raise ValueError(f"Unknown reordering method '{method}', expected 'rcm' or 'morton'")
+
+        # Relabel the vertices of elements
+        vertex_order = vertex_order.astype(np.int64)
+        new_index = np.empty_like(vertex_order)
+        new_index[vertex_order] = np.arange(vertex_order.size)
+        T_new = new_index[T].astype(T.dtype)
+
+        # Compute the element order
+        if method == 'rcm':
+            element_order = np.lexsort((T_new.max(axis=1), T_new.min(axis=1)))
+        else:
+            element_order = np.argsort(morton_codes(V[T].mean(axis=1)), kind='stable')
+
+        mesh = TetMesh(V[vertex_order], T_new[element_order])
+        return mesh, vertex_order, element_order
+
+    @cached
+    def vertex_elements(self) -> csr_matrix:
+        '''
+        Return the (NxM) sparse vertex-to-element incidence matrix in CSR format, M = #elements.
+        The elements around vertex i are `indices[indptr[i]:indptr[i + 1]]` in ascending order.
+        '''
+        T, num_vertices = self.T, self.V.shape[0]
+
+        # Group the element slots by vertex. The stable sort keeps elements in ascending order.
+        order = np.argsort(T.ravel(), kind='stable')
+        counts = np.bincount(T.ravel(), minlength=num_vertices)
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return csr_matrix((np.ones(order.size, dtype=np.int8), order // T.shape[1], indptr),
+                          shape=(num_vertices, T.shape[0]))
+
+    @cached
+    def faces(self) -> Tuple[array, array]:
+        '''
+        Return the unique triangle faces of the tet mesh.
+
+        Return values:
+            * `faces: array`     - (Fx3) unique faces, each with its vertex indices sorted
+            * `tet_faces: array` - (Mx4), face `TET_FACES[k]` of element t is
+                `faces[tet_faces[t, k]]`
+        '''
+        T, num_vertices = self.T, self.V.shape[0]
+
+        # Identify each face by its sorted vertex indices
+        sorted_faces = np.sort(T[:, TET_FACES].reshape(-1, 3), axis=1).astype(np.int64)
+
+        # Hash the sorted faces into integer keys, or compare the raw rows when they do not fit
+        if num_vertices < 2 ** 21:
+            keys = (sorted_faces[:, 0] << 42) | (sorted_faces[:, 1] << 21) | sorted_faces[:, 2]
+        else:
+            keys = np.ascontiguousarray(sorted_faces).view(np.dtype((np.void, 24))).ravel()
+
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        return sorted_faces[first], inverse.reshape(T.shape[0], -1)
+
+    @cached
+    def face_neighbors(self) -> array:
+        '''
+        Return the (Mx4) face neighbors of tet elements, where entry (t, k) is the element on the
+        other side of face `TET_FACES[k]` of element t, or -1 if the face is on the boundary.
+        '''
+        _, tet_faces = self.faces()
+        face_ids = tet_faces.ravel()
+
+        # Pair up the two element slots of every interior face
+        order = np.argsort(face_ids, kind='stable')
+        shared = np.nonzero(face_ids[order[1:]] == face_ids[order[:-1]])[0]
+        first, second = order[shared], order[shared + 1]
+
+        neighbors = np.full(face_ids.size, -1, dtype=np.int64)
+        neighbors[first] = second // tet_faces.shape[1]
+        neighbors[second] = first // tet_faces.shape[1]
+        return neighbors.reshape(tet_faces.shape)
+
+    @cached
+    def edges(self) -> array:
+        '''
+        Return the (Ex2) unique edges of the tet mesh, each with its vertex indices sorted.
+        '''
+        T, num_vertices = self.T, self.V.shape[0]
+
+        # Hash the sorted edges into integer keys and remove duplicates
+        edges = T[:, TET_EDGES].reshape(-1, 2).astype(np.int64)
+        lo, hi = np.minimum(edges[:, 0], edges[:, 1]), np.maximum(edges[:, 0], edges[:, 1])
+        keys = np.sort(lo * num_vertices + hi)
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        return np.stack((keys // num_vertices, keys % num_vertices), axis=1)
+
+    @cached
+    def boundary_faces(self) -> array:
+        '''
+        Extract the boundary surface of the tet mesh, i.e., the faces that belong to exactly one
+        tet element. Interior faces are shared by two elements and cancel out.
+
+        Return value:
+            * `faces: array` - (Fx3) vertex indices of boundary triangles, oriented as in
+                `TET_FACES`
+        '''
+        # Keep the faces that occur only once
+        _, tet_faces = self.faces()
+        counts = np.bincount(tet_faces.ravel())
+        faces = self.T[:, TET_FACES].reshape(-1, 3)
+        return faces[counts[tet_faces.ravel()] == 1]
+
+    def compact(self, tolerance: float=None) -> Tuple['TetMesh', array, array]:
+        '''
+        Remove the vertices not referenced by any element, and optionally weld the remaining
+        vertices that lie within `tolerance` of each other (see `weld_labels`). A welded group
+        of vertices is replaced by its first vertex. The order of the kept vertices is preserved.
+
+        Params:
+            * `tolerance: float` - welding distance. None disables welding, while 0 only welds
+                exactly coincident vertices.
+
+        Return values:
+            * `mesh: TetMesh`       - the compacted tet mesh
+            * `vertex_map: array`   - (N), the old vertex i becomes the new vertex
+                vertex_map[i], or -1 if it is unreferenced
+            * `vertex_order: array` - (N'), the new vertex i is the old vertex vertex_order[i]
+
+        Per-vertex data are mapped to the compacted mesh by `U_compact = U[vertex_order]`.
+        Elements with welded vertices may collapse, which `mesh_quality.repair_elements`
+        removes.
+        '''
+        V, T = self.V, self.T
+
+        # Find the referenced vertices
+        referenced = np.nonzero(np.bincount(T.ravel(), minlength=V.shape[0]))[0]
+
+        # Label the referenced vertices by their welded groups
+        if tolerance is None:
+            labels = np.arange(referenced.size)
+        else:
+            labels = weld_labels(V[referenced], tolerance)
+
+        # Keep the first vertex of every group. Groups are numbered by their first vertices, so
+        # the first occurrences of labels appear in ascending order.
+        is_first = np.zeros(referenced.size, dtype=bool)
+        is_first[np.unique(labels, return_index=True)[1]] = True
+        vertex_order = referenced[is_first]
+
+        vertex_map = np.full(V.shape[0], -1, dtype=np.int64)
+        vertex_map[referenced] = labels
+
+        mesh = TetMesh(V[vertex_order], vertex_map[T].astype(T.dtype))
+        return mesh, vertex_map, vertex_order
+
+    def write_to_file(self, file_name: str, invert_normal: bool=False, binary: bool=True,
+                      surface: bool=True):
         '''
         Write the tet mesh in STL format.
+
+        Params:
+            * `file_name: str`      - path to the output file
+            * `invert_normal: bool` - whether to flip the orientation of all triangles
+            * `binary: bool`        - write binary STL (single precision) instead of ASCII
+            * `surface: bool`       - write only the boundary surface instead of all four faces
+                of every tet element
         '''
         # Store mesh data into local variables (eliminates lookup overhead)
-        V, T = self.V, self.T
+        V = self.V
 
-        # Vertex indices of four triangles in a tet element
-        tri_indices = [[0, 1, 2], [1, 3, 2], [1, 0, 3], [0, 2, 3]]
+        # Vertex indices of triangles
+        faces = self.boundary_faces() if surface else self.T[:, TET_FACES].reshape(-1, 3)
 
         # Optionally invert normal
         if invert_normal:
-            tri_indices = [[i, k, j] for i, j, k in tri_indices]
+            faces = faces[:, [0, 2, 1]]
+
+        # Compute the triangle vertices and unit normals
+        triangles = V[faces]
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = normals / np.where(lengths > 0, lengths, 1)
 
-        with open(file_name, 'w') as f:
+        if binary:
+            # Binary STL: an 80-byte header, the triangle count, and one 50-byte record per
+            # triangle, which are filled in a single structured buffer
+            records = np.zeros(faces.shape[0], dtype=STL_RECORD)
+            records['normal'] = normals
+            records['vertices'] = triangles
+
+            with open(file_name, 'wb') as f:
+                f.write(b'tet_mesh'.ljust(80, b'\0'))
+                f.write(struct.pack('<I', faces.shape[0]))
+                f.write(records.tobytes())
+
+        else:
+            # Format all triangles with one template
+            facet = ('facet normal %r %r %r\n'
+                     '    outer loop\n'
+                     '        vertex %r %r %r\n'
+                     '        vertex %r %r %r\n'
+                     '        vertex %r %r %r\n'
+                     '    endloop\n'
+                     'endfacet\n')
+            values = np.hstack((normals, triangles.reshape(-1, 9))).tolist()
+
+            with open(file_name, 'w') as f:
+                f.write('solid tet_mesh\n')
+                f.write(''.join([facet % tuple(row) for row in values]))
+                f.write('endsolid')
+
+    def write_vtk(self, file_name: str, point_data: Dict[str, array]=None,
+                  cell_data: Dict[str, array]=None, binary: bool=True):
+        '''
+        Write the tet mesh in legacy VTK format (unstructured grid) for visualization, e.g., in
+        ParaView. Optional per-vertex (`point_data`) and per-element (`cell_data`) fields are
+        written as scalars (n), vectors (nx3) or tensors (nx3x3). `binary` selects the binary
+        (big-endian) encoding over ASCII.
+        '''
+        V, T = self.V, self.T
+
+        def write_array(f: BinaryIO, values: array, dtype: str):
+            if binary:
+                f.write(np.ascontiguousarray(values, dtype=f'>{dtype}').tobytes())
+            else:
+                np.savetxt(f, values.reshape(values.shape[0], -1),
+                           fmt='%d' if dtype == 'i4' else '%.10g')
+            f.write(b'\n')
+
+        def write_fields(f: BinaryIO, fields: Dict[str, array], size: int):
+            for name, values in fields.items():
+                values = np.asarray(values)
+                if values.shape == (size,):
+                    f.write(f'SCALARS {name} double 1\nLOOKUP_TABLE default\n'.encode())
+                elif values.shape == (size, 3):
+                    f.write(f'VECTORS {name} double\n'.encode())
+                elif values.shape == (size, 3, 3):
+                    f.write(f'TENSORS {name} double\n'.encode())
+                else:
+                    raise ValueError(f"Invalid shape of field '{name}': {values.shape}, should "
+                                     f"be ({size}), ({size}, 3) or ({size}, 3, 3)")
+                write_array(f, values, 'f8')
+
+        with open(file_name, 'wb') as f:
             # Write header
-            f.write('solid tet_mesh\n')
+            f.write(b'# vtk DataFile Version 3.0\ntet_mesh\n')
+            f.write(b'BINARY\n' if binary else b'ASCII\n')
+            f.write(b'DATASET UNSTRUCTURED_GRID\n')
 
-            # Write tets
-            for tet in T:
-                for indices in tri_indices:
-                    # Get the current triangle
-                    tri = V[tet[indices]]
+            # Write vertices and tets (VTK cell type 10)
+            f.write(f'POINTS {V.shape[0]} double\n'.encode())
+            write_array(f, V, 'f8')
 
-                    # Write the vertices of the current triangle
-                    f.write(
-                        f'facet normal 0 0 0\n'
-                        f'    outer loop\n'
-                        f'        vertex {tri[0, 0]} {tri[0, 1]} {tri[0, 2]}\n'
-                        f'        vertex {tri[1, 0]} {tri[1, 1]} {tri[1, 2]}\n'
-                        f'        vertex {tri[2, 0]} {tri[2, 1]} {tri[2, 2]}\n'
-                        f'    endloop\n'
-                        f'endfacet\n'
-                    )
+            cells = np.hstack((np.full((T.shape[0], 1), T.shape[1]), T))
+            f.write(f'CELLS {T.shape[0]} {cells.size}\n'.encode())
+            write_array(f, cells, 'i4')
+            f.write(f'CELL_TYPES {T.shape[0]}\n'.encode())
+            write_array(f, np.full(T.shape[0], 10), 'i4')
 
-            # Write footer
-            f.write('endsolid')
+            # Write fields
+            if cell_data:
+                f.write(f'CELL_DATA {T.shape[0]}\n'.encode())
+                write_fields(f, cell_data, T.shape[0])
+            if point_data:
+                f.write(f'POINT_DATA {V.shape[0]}\n'.encode())
+                write_fields(f, point_data, V.shape[0])
 
 
 def tet_mesh_cuboid(nx: int, ny: int, nz: int, cube_size: float) -> TetMesh:
@@ -123,23 +623,74 @@ def tet_mesh_cuboid(nx: int, ny: int, nz: int, cube_size: float) -> TetMesh:
     return TetMesh(vertices, elements)
 
 
-def tet_mesh_from_file(file_name: str, max_size: float=0.0) -> TetMesh:
+def tet_mesh_from_file(file_name: str, max_size: float=0.0, mmap: bool=False,
+                       cache: bool=False) -> TetMesh:
     '''
     Read a tet mesh from binary file (backward compatibility with HW3). Optionally scale the mesh
     so that its longest dimension is equal to `max_size`.
+
+    With `mmap`, the vertex and element arrays are memory-mapped from the file instead of being
+    read, so that large meshes open instantly and their pages are loaded on demand. The arrays
+    are read-only.
+
+    With `cache`, the scaled vertex array is saved in a '.V.npy' sidecar file next to the mesh
+    file and reused by later calls, provided that the modification time and the fingerprint
+    (see `file_fingerprint`) of the mesh file and `max_size` still match those recorded in the
+    '.cache.json' sidecar file. Otherwise, the cache is rebuilt. Cached vertices are also
+    memory-mapped in `mmap` mode.
     '''
-    # Read mesh data
-    with open(file_name, 'rb') as f:
-        # Read the vertex array (V)
-        V = read_array_from_file(f, np.dtype(np.float64))
+    # Check the vertex cache
+    V = None
+    cache_file_name, meta_file_name = f'{file_name}.V.npy', f'{file_name}.cache.json'
+    if cache:
+        meta = {
+            'mtime_ns': os.stat(file_name).st_mtime_ns,
+            'fingerprint': file_fingerprint(file_name),
+            'max_size': max_size,
+        }
+        try:
+            with open(meta_file_name) as f:
+                if json.load(f) == meta:
+                    V = np.load(cache_file_name, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            pass
+
+    # Read mesh data. Arrays are memory-mapped in `mmap` mode, and also when the vertices are
+    # cached, which skips reading the vertex array in the file
+    if mmap or V is not None:
+        # Map the vertex array (V) and the elements array (T)
+        V_file, offset = memmap_array_from_file(file_name, 0, np.dtype(np.float64))
+        T, _ = memmap_array_from_file(file_name, offset, np.dtype(np.int32))
+        T = T if mmap else np.array(T)
+    else:
+        with open(file_name, 'rb') as f:
+            # Read the vertex array (V)
+            V_file = read_array_from_file(f, np.dtype(np.float64))
 
-        # Read the elements array (T)
-        T = read_array_from_file(f, np.dtype(np.int32))
+            # Read the elements array (T)
+            T = read_array_from_file(f, np.dtype(np.int32))
 
     # Optionally scale the mesh
-    if max_size > 0.0:
-        bbox_size = V.max(axis=0) - V.min(axis=0)
-        V = V * (max_size / bbox_size.max())
+    if V is None:
+        V = V_file
+        if max_size > 0.0:
+            bbox_size = V.max(axis=0) - V.min(axis=0)
+            V = V * (max_size / bbox_size.max())
+
+        # Save the vertex cache. The metadata is removed first and written last, so that an
+        # interrupted write never leaves a valid-looking cache behind.
+        if cache:
+            if os.path.exists(meta_file_name):
+                os.remove(meta_file_name)
+            with open(f'{cache_file_name}.tmp', 'wb') as f:
+                np.save(f, V)
+            with open(f'{meta_file_name}.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(f'{cache_file_name}.tmp', cache_file_name)
+            os.replace(f'{meta_file_name}.tmp', meta_file_name)
+
+            if mmap:
+                V = np.load(cache_file_name, mmap_mode='r')
 
     # Construct and return a tet mesh
-    return TetMesh(V, T)
+    return TetMesh(np.asarray(V), T)
@@ -0,0 +1,137 @@
+from functools import wraps
+from typing import Any, Callable, Dict, List
+
+import time
+import json
+
+
+class Timer:
+    '''
+    Context manager that adds its wall time and one call to a named timer of an
+    `Instrumentation` object.
+    '''
+    def __init__(self, instrumentation: 'Instrumentation', name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        elapsed = time.perf_counter() - self.start_time
+        timer = self.instrumentation.timers.setdefault(self.name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += elapsed
+
+
+class NullTimer:
+    '''
+    Context manager that does nothing, used when instrumentation is disabled.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+# A shared instance avoids creating a context manager per call when instrumentation is disabled
+NULL_TIMER = NullTimer()
+
+
+class Instrumentation:
+    '''
+    Collects wall times and call counts of named code sections (timers), named counters, and
+    named value histories. All methods return immediately when instrumentation is disabled.
+
+    Timers are inclusive, i.e., the time of a section also includes the time of the timed
+    sections nested inside it.
+    '''
+    def __init__(self, enabled: bool=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        '''
+        Clear all recorded data.
+        '''
+        self.timers: Dict[str, List] = {}
+        self.counters: Dict[str, int] = {}
+        self.histories: Dict[str, List] = {}
+
+    def timer(self, name: str):
+        '''
+        Return a context manager that times the enclosed code section under `name`.
+        '''
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def count(self, name: str, value: int=1):
+        '''
+        Add `value` to the counter `name`.
+        '''
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, value: Any):
+        '''
+        Append `value` to the history `name`.
+        '''
+        if self.enabled:
+            self.histories.setdefault(name, []).append(value)
+
+    def to_dict(self) -> Dict:
+        '''
+        Export the recorded data as a dictionary with the following entries:
+            * `timers: dict`    - {name: {'calls': int, 'time': float}}, times in seconds
+            * `counters: dict`  - {name: int}
+            * `histories: dict` - {name: list}
+        '''
+        return {
+            'timers': {name: {'calls': calls, 'time': elapsed}
+                       for name, (calls, elapsed) in self.timers.items()},
+            'counters': dict(self.counters),
+            'histories': {name: list(values) for name, values in self.histories.items()},
+        }
+
+    def to_json(self, file_name: str='', indent: int=2) -> str:
+        '''
+        Export the recorded data in JSON format, and optionally write it to a file.
+        '''
+        # NumPy scalars and arrays are converted into Python numbers and lists
+        def convert(value):
+            return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+        text = json.dumps(self.to_dict(), indent=indent, default=convert)
+        if file_name:
+            with open(file_name, 'w') as f:
+                f.write(text)
+        return text
+
+    def summary(self) -> str:
+        '''
+        Format the timers and counters as a human-readable table.
+        '''
+        lines = [f'{"section":<24} {"calls":>7} {"time (s)":>10}']
+        for name, (calls, elapsed) in sorted(self.timers.items(), key=lambda t: -t[1][1]):
+            lines.append(f'{name:<24} {calls:>7} {elapsed:>10.4f}')
+        for name, value in self.counters.items():
+            lines.append(f'{name:<24} {value:>7}')
+        return '\n'.join(lines)
+
+
+def timed(name: str) -> Callable:
+    '''
+    Decorator that times a method under `name` using the `instrumentation` attribute of its
+    object.
+    '''
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with instrumentation.timer(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
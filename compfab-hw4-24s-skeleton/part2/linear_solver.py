@@ -0,0 +1,230 @@
+from abc import ABC, abstractmethod
+from numpy import ndarray as array
+from scipy.sparse import spmatrix
+from scipy.sparse.linalg import cg, splu, spilu, LinearOperator
+from inspect import signature
+from typing import Callable, Dict, Tuple, Union
+
+import time
+import numpy as np
+
+# SciPy renamed the relative tolerance of its iterative solvers from `tol` to `rtol` in v1.12
+CG_TOL_ARG = 'rtol' if 'rtol' in signature(cg).parameters else 'tol'
+
+
+class LinearSolver(ABC):
+    '''
+    Abstract class for solvers of sparse symmetric linear systems A * x = b.
+
+    Every call to `solve` returns the solution together with a dictionary of solver statistics:
+        * `solver: str`      - name of the solver
+        * `status: int`      - 0 on success, > 0 if the iteration budget ran out, < 0 on failure
+        * `iterations: int`  - number of iterations (0 for direct solvers)
+        * `residual: float`  - relative residual norm |b - A * x| / |b|
+        * `time: float`      - wall time of the solve in seconds
+    '''
+    def __init__(self, tol: float=1e-5):
+        '''
+        `tol` is the relative residual tolerance of the solver.
+        '''
+        self.tol = tol
+        self.name = 'unknown'
+
+    @abstractmethod
+    def run(self, A: spmatrix, b: array, x0: array=None, tol: float=None) -> Tuple[array, Dict]: ...
+
+    def solve(self, A: spmatrix, b: array, x0: array=None,
+              tol: float=None) -> Tuple[array, Dict]:
+        '''
+        Solve A * x = b, optionally starting from an initial guess `x0`. The relative tolerance
+        `tol` overrides the default one of the solver for this call only.
+
+        Return values:
+            * `x: array`     - the solution vector
+            * `stats: dict`  - solver statistics
+        '''
+        start_time = time.perf_counter()
+        x, stats = self.run(A, b, x0, tol)
+        stats['time'] = time.perf_counter() - start_time
+
+        # Measure the relative residual of the solution
+        b_norm = np.linalg.norm(b)
+        stats['residual'] = np.linalg.norm(b - A @ x) / b_norm if b_norm > 0 else 0.0
+        stats['solver'] = self.name
+        return x, stats
+
+
+def jacobi_preconditioner(A: spmatrix) -> LinearOperator:
+    '''
+    Point Jacobi preconditioner, i.e., the inverse of the diagonal of A.
+    '''
+    inv_diag = 1 / A.diagonal()
+    return LinearOperator(A.shape, matvec=lambda x: inv_diag * x.ravel(), dtype=A.dtype)
+
+
+def block_jacobi_preconditioner(A: spmatrix, block_size: int=3) -> LinearOperator:
+    '''
+    Block Jacobi preconditioner built from the inverses of the (block_size x block_size) diagonal
+    blocks of A. For FEM stiffness matrices, each block holds the DOFs of one vertex.
+    '''
+    assert A.shape[0] % block_size == 0, \
+        f'The matrix size {A.shape[0]} is not a multiple of the block size {block_size}'
+
+    # Gather the entries of A inside the diagonal blocks
+    A = A.tocoo()
+    in_block = A.row // block_size == A.col // block_size
+    rows, cols = A.row[in_block], A.col[in_block]
+
+    blocks = np.zeros((A.shape[0] // block_size, block_size, block_size), dtype=A.dtype)
+    block_indices = (rows // block_size, rows % block_size, cols % block_size)
+    np.add.at(blocks, block_indices, A.data[in_block])
+
+    # Invert all diagonal blocks at once
+    inv_blocks = np.linalg.inv(blocks)
+
+    def matvec(x: array) -> array:
+        return np.einsum('bij,bj->bi', inv_blocks, x.reshape(-1, block_size)).ravel()
+
+    return LinearOperator(A.shape, matvec=matvec, dtype=A.dtype)
+
+
+def ilu_preconditioner(A: spmatrix, drop_tol: float=1e-4,
+                       fill_factor: float=10) -> LinearOperator:
+    '''
+    Incomplete LU preconditioner. SciPy has no incomplete Cholesky factorization, so the
+    threshold-based incomplete LU factorization of the symmetric matrix A is used instead. It runs
+    in symmetric mode (symmetric ordering, diagonal pivots) to stay close to incomplete Cholesky,
+    but the result is not guaranteed to be symmetric positive definite.
+    '''
+    ilu = spilu(A.tocsc(), drop_tol=drop_tol, fill_factor=fill_factor,
+                permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0,
+                options={'SymmetricMode': True})
+    return LinearOperator(A.shape, matvec=ilu.solve, dtype=A.dtype)
+
+
+# Registry of preconditioners by name
+PRECONDITIONERS: Dict[str, Callable[[spmatrix], LinearOperator]] = {
+    'jacobi': jacobi_preconditioner,
+    'block_jacobi': block_jacobi_preconditioner,
+    'ilu': ilu_preconditioner,
+}
+
+
+class ConjugateGradient(LinearSolver):
+    '''
+    Conjugate gradient method, optionally with a preconditioner ('jacobi', 'block_jacobi' or
+    'ilu'). The preconditioner is rebuilt only when the matrix changes.
+
+    If `record_residuals` is True, the relative residual norm of every iteration is recorded in
+    the `residual_history` entry of the solver statistics. This costs one extra product with A
+    per iteration.
+    '''
+    def __init__(self, tol: float=1e-5, max_iters: int=None, preconditioner: str=None,
+                 record_residuals: bool=False):
+        super().__init__(tol)
+
+        # Check input validity
+        assert preconditioner is None or preconditioner in PRECONDITIONERS, \
+            f"Unknown preconditioner '{preconditioner}', expected one of {list(PRECONDITIONERS)}"
+
+        self.max_iters = max_iters
+        self.preconditioner_type = preconditioner
+        self.name = 'cg' if preconditioner is None else f'pcg-{preconditioner}'
+        self.record_residuals = record_residuals
+
+        # The matrix that the cached preconditioner is built from
+        self.A = None
+        self.M = None
+
+    def preconditioner(self, A: spmatrix) -> LinearOperator:
+        '''
+        Get the preconditioner of A, which is rebuilt if A is a different matrix than last time.
+        '''
+        if self.preconditioner_type is not None and A is not self.A:
+            self.A, self.M = A, PRECONDITIONERS[self.preconditioner_type](A)
+        return self.M
+
+    def run(self, A: spmatrix, b: array, x0: array=None, tol: float=None) -> Tuple[array, Dict]:
+        # Count the iterations (and optionally record the residuals) using the CG callback
+        num_iters, residuals = 0, []
+        b_norm = np.linalg.norm(b) if self.record_residuals else 0.0
+
+        def count_iteration(xk: array):
+            nonlocal num_iters
+            num_iters += 1
+            if self.record_residuals:
+                residuals.append(np.linalg.norm(b - A @ xk) / b_norm if b_norm > 0 else 0.0)
+
+        x, status = cg(A, b, x0=x0, maxiter=self.max_iters, M=self.preconditioner(A),
+                       callback=count_iteration, **{CG_TOL_ARG: self.tol if tol is None else tol})
+
+        stats = {'status': status, 'iterations': num_iters}
+        if self.record_residuals:
+            stats['residual_history'] = residuals
+        return x, stats
+
+
+class PreconditionedCG(ConjugateGradient):
+    '''
+    Conjugate gradient method that uses the Jacobi preconditioner by default.
+    '''
+    def __init__(self, tol: float=1e-5, max_iters: int=None, preconditioner: str='jacobi',
+                 record_residuals: bool=False):
+        super().__init__(tol, max_iters, preconditioner, record_residuals)
+
+
+class DirectSolver(LinearSolver):
+    '''
+    Sparse direct solver using the SuperLU factorization. The factorization is reused across
+    repeated solves with the same matrix.
+    '''
+    def __init__(self):
+        super().__init__(0.0)
+
+        self.name = 'direct'
+
+        # The matrix that the cached factorization is computed from
+        self.A = None
+        self.factor = None
+
+    def run(self, A: spmatrix, b: array, x0: array=None, tol: float=None) -> Tuple[array, Dict]:
+        # Factorize the matrix if it changes. The column ordering for symmetric matrices reduces
+        # fill-in compared with the default one.
+        factorized = A is not self.A
+        if factorized:
+            self.factor = splu(A.tocsc(), permc_spec='MMD_AT_PLUS_A')
+            self.A = A
+
+        x = self.factor.solve(b)
+        return x, {'status': 0, 'iterations': 0, 'factorized': factorized}
+
+
+# Registry of solver backends by name
+SOLVERS = {
+    'cg': ConjugateGradient,
+    'pcg': PreconditionedCG,
+    'direct': DirectSolver,
+}
+
+
+def make_solver(solver: Union[str, LinearSolver], **options) -> LinearSolver:
+    '''
+    Create a linear solver from its name ('cg', 'pcg' or 'direct') and solver-specific options,
+    e.g., `preconditioner` for CG solvers. Solver instances are passed through unchanged, so they
+    take no options.
+    '''
+    if isinstance(solver, LinearSolver):
+        if options:
+            raise ValueError(f'Options {list(options)} cannot be applied to an existing '
+                             f"'{solver.name}' solver instance")
+        return solver
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown linear solver '{solver}', expected one of {list(SOLVERS)}")
+
+    # Check the options against those accepted by the backend
+    accepted = set(signature(SOLVERS[solver]).parameters)
+    unknown = [name for name in options if name not in accepted]
+    if unknown:
+        raise ValueError(f"The '{solver}' solver does not accept the options {unknown}, "
+                         f'expected a subset of {sorted(accepted)}')
+    return SOLVERS[solver](**options)
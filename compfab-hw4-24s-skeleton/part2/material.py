@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from numpy import ndarray as array
+from typing import Callable, Tuple
 
 import numpy as np
 
@@ -7,6 +8,10 @@ import numpy as np
 class Material(ABC):
     '''
     Abstract class for material models.
+
+    Material models are evaluated over a batch of deformation gradients, i.e., a (Txdxd) stack of
+    F matrices where T is the number of tet elements. The single-F methods are thin wrappers
+    around their batched counterparts.
     '''
     def __init__(self, E: float, nu: float):
         '''
@@ -22,14 +27,89 @@ class Material(ABC):
 
         self.type = 'unknown'
 
+        # Whether dP/dF is independent of F, i.e., the stiffness matrix is constant
+        self.constant_stiffness = False
+
     @abstractmethod
-    def energy_density(self, F: array) -> float: ...
+    def energy_density_batch(self, F: array) -> array:
+        '''
+        Compute the energy densities W of (Txdxd) deformation gradients. Returns a (T) array.
+        '''
 
     @abstractmethod
-    def stress_tensor(self, F: array) -> array: ...
+    def stress_tensor_batch(self, F: array) -> array:
+        '''
+        Compute the stress tensors P of (Txdxd) deformation gradients. Returns a (Txdxd) array.
+        '''
 
     @abstractmethod
-    def stress_differential(self, F: array) -> array: ...
+    def stress_differential_batch(self, F: array) -> array:
+        '''
+        Compute dP/dF of (Txdxd) deformation gradients. Returns a (Txd^2xd^2) array.
+        '''
+
+    def evaluate_batch(self, F: array, differential: bool=False) -> Tuple[array, array, array]:
+        '''
+        Compute the energy densities, the stress tensors and optionally dP/dF of (Txdxd)
+        deformation gradients in one pass. Subclasses may override it to share intermediate
+        results (e.g., inverses and determinants of F) among the three quantities.
+
+        Return values:
+            * `W: array`     - (T) energy densities
+            * `P: array`     - (Txdxd) stress tensors
+            * `dP_dF: array` - (Txd^2xd^2) gradients of the stress tensors, None if
+                `differential` is False
+        '''
+        W = self.energy_density_batch(F)
+        P = self.stress_tensor_batch(F)
+        dP_dF = self.stress_differential_batch(F) if differential else None
+        return W, P, dP_dF
+
+    def cauchy_stress_batch(self, F: array, P: array) -> array:
+        '''
+        Convert (Txdxd) first Piola-Kirchhoff stress tensors P at deformation gradients F into
+        Cauchy stress tensors.
+        Formula:
+            sigma = P * F.T / det(F)
+        '''
+        J = np.linalg.det(F)
+        return (P @ F.transpose(0, 2, 1)) / J[:, None, None]
+
+    def stress_differential_operator(self, F: array) -> Callable[[array], array]:
+        '''
+        Build the linear map dF -> dP = dP/dF : dF at (Txdxd) deformation gradients F, where dF and
+        dP are (Txdxd) arrays. This is the matrix-free counterpart of `stress_differential_batch`.
+
+        The default implementation contracts the full dP/dF. Subclasses may override it with a
+        closed form that avoids storing d^4 values per element.
+        '''
+        dP_dF = self.stress_differential_batch(F)
+
+        def apply(dF: array) -> array:
+            # Matrices are vectorized column by column, which is the layout of dP/dF
+            dF_vec = dF.transpose(0, 2, 1).reshape(dF.shape[0], -1)
+            dP_vec = np.einsum('tij,tj->ti', dP_dF, dF_vec)
+            return dP_vec.reshape(dF.shape).transpose(0, 2, 1)
+
+        return apply
+
+    def energy_density(self, F: array) -> float:
+        '''
+        Compute the energy density W of a single (dxd) deformation gradient.
+        '''
+        return self.energy_density_batch(F[None])[0]
+
+    def stress_tensor(self, F: array) -> array:
+        '''
+        Compute the stress tensor P of a single (dxd) deformation gradient.
+        '''
+        return self.stress_tensor_batch(F[None])[0]
+
+    def stress_differential(self, F: array) -> array:
+        '''
+        Compute dP/dF of a single (dxd) deformation gradient.
+        '''
+        return self.stress_differential_batch(F[None])[0]
 
 
 class LinearElastic(Material):
@@ -41,86 +121,88 @@ class LinearElastic(Material):
         super().__init__(E, nu)
 
         self.type = 'linear'
+        self.constant_stiffness = True
 
-    def energy_density(self, F: array) -> float:
+    def energy_density_batch(self, F: array) -> array:
         '''
         Compute the energy density W.
         Formula:
             eps = 0.5 * (F + F.T) - I
             W = mu * (eps : eps) + 0.5 * lm * tr(eps) ** 2
         '''
-        strain = 0.5 * (F + F.T) - np.eye(F.shape[0])
-        strain_contract = np.dot(strain.ravel(), strain.ravel())
-        W = self.mu * strain_contract + 0.5 * self.lm * strain.trace() ** 2
+        strain = 0.5 * (F + F.transpose(0, 2, 1)) - np.eye(F.shape[1])
+        strain_contract = np.einsum('tij,tij->t', strain, strain)
+        strain_trace = np.trace(strain, axis1=1, axis2=2)
+        W = self.mu * strain_contract + 0.5 * self.lm * strain_trace ** 2
         return W
 
-    def stress_tensor(self, F: array) -> array:
+    def stress_tensor_batch(self, F: array) -> array:
         '''
         Compute the stress tensor P.
         Formula:
             P = mu * (F + F.T - 2I) + lm * (tr(F) - dim) * I
         '''
-        dim, I = F.shape[0], np.eye(F.shape[0])
-        P = self.mu * (F + F.T - 2 * I) + self.lm * (F.trace() - dim) * I
+        dim, I = F.shape[1], np.eye(F.shape[1])
+        F_trace = np.trace(F, axis1=1, axis2=2)
+        P = self.mu * (F + F.transpose(0, 2, 1) - 2 * I) \
+            + self.lm * (F_trace - dim)[:, None, None] * I
         return P
 
-    def stress_differential(self, F: array) -> array:
+    def cauchy_stress_batch(self, F: array, P: array) -> array:
+        '''
+        Small-strain theory does not distinguish between stress measures, so the Cauchy stress
+        is P itself.
+        '''
+        return P
+
+    def stress_differential_batch(self, F: array) -> array:
         '''
         Compute the differential of the stress tensor P w.r.t. the deformation gradient F.
 
         Params:
-            * `F: array` - (dxd) the deformation gradient, d = #dimensions
+            * `F: array` - (Txdxd) the deformation gradients, T = #elements, d = #dimensions
 
         Return value:
-            * `dP_dF: array` - (d^2 x d^2) the gradient of the stress tensor P w.r.t. F
+            * `dP_dF: array` - (Txd^2xd^2) the gradients of the stress tensor P w.r.t. F. dP/dF is
+                constant for this material, so the result is a read-only broadcast view.
         '''
         # Here we use the chain rule to compute dP/dF.
         #   - First, we compute D1 = d(F + F.T)/dF, which equals to I + d(F.T)/dF
         #   - Then, we compute D2 = d(F.trace() * I)/dF
         #   - Finally, we combine D1 and D2 to obtain dP/dF
-        # You will complete this process in the code below
 
         # Constants
-        dim, dim2 = F.shape[0], F.shape[0] ** 2
+        dim, dim2 = F.shape[1], F.shape[1] ** 2
         mu, lm = self.mu, self.lm
 
-        #print(f"defomation gradient F:{F}")
-        # Compute d(F.T)/dF
-        # --------
-        # TODO: Your code here. Think about which elements in d(F.T)/dF are non-zero.
-        dFT_dF = np.zeros((dim2, dim2))
-        for i in range(dim):       
-            for j in range(dim):    
-                dFT_dF_idx = j * dim + i  # Index in flattened d(F^T)/dF for the derivative of F^T[j,i] w.r.t F[i,j]  # <--
-                F_idx = i * dim + j  # Corresponding index in the flattened version of F  # <--
-                dFT_dF[F_idx,dFT_dF_idx] = 1 
-
-        #print(f"dFT_dF:{dFT_dF}")
+        # Compute d(F.T)/dF, which maps the (i, j)-th element of F to the (j, i)-th element
+        dFT_dF = np.eye(dim2)[np.arange(dim2).reshape(dim, dim).T.ravel()]
 
         # Compute D1
-        # --------
-        # TODO: Your code here.
-        # HINT: The `np.eye(n)` function creates an identify matrix of size nxn
-        D1 = np.eye(dim2) + dFT_dF # I + d(F.T)/dF
-
-        # Compute D2 = d(F.trace() * I)/dF
-        # --------
-        # trace is the sum of its diagonal elements. The trace multiplied by I
-        # affects only the diagonal elements of F, scaled by the identity matrix
-        # tr(F) affects all diagonal elements of tr(F)*I equally
-        #TODO: Your code here. Think about which elements in D2 are non-zero
-        I_dxd = np.eye(dim)
-        D2 = np.zeros((dim2, dim2))
-        for i in range(dim):       
-                D2[i*dim + i] = I_dxd.flatten() 
+        D1 = np.eye(dim2) + dFT_dF
 
+        # Compute D2. tr(F) affects all diagonal elements of tr(F) * I equally
+        I_vec = np.eye(dim).ravel()
+        D2 = np.outer(I_vec, I_vec)
 
         # Compute dP/dF
-        # --------
-        # TODO: Your code here.
-        dP_dF = mu*D1 +lm*D2     # <--
+        dP_dF = mu * D1 + lm * D2
 
-        return dP_dF
+        return np.broadcast_to(dP_dF, (F.shape[0], dim2, dim2))
+
+    def stress_differential_operator(self, F: array) -> Callable[[array], array]:
+        '''
+        Build the linear map dF -> dP at deformation gradients F.
+        Formula:
+            dP = mu * (dF + dF.T) + lm * tr(dF) * I
+        '''
+        mu, lm, I = self.mu, self.lm, np.eye(F.shape[1])
+
+        def apply(dF: array) -> array:
+            dF_trace = np.trace(dF, axis1=1, axis2=2)
+            return mu * (dF + dF.transpose(0, 2, 1)) + lm * dF_trace[:, None, None] * I
+
+        return apply
 
 
 class NeoHookean(Material):
@@ -133,40 +215,44 @@ class NeoHookean(Material):
 
         self.type = 'nonlinear'
 
-    def energy_density(self, F: array) -> float:
+    def energy_density_batch(self, F: array, logJ: array=None) -> array:
         '''
-        Compute the energy density W.
+        Compute the energy density W. `logJ` optionally holds precomputed log(det(F)).
         Formula:
             I1 = tr(F.T * F)
             J = det(F)
             W = 0.5 * mu * (I1 - dim - 2 * log(J)) + 0.5 * lm * log(J) ** 2
         '''
-        dim = F.shape[0]
-        I1 = np.dot(F.ravel(), F.ravel())
-        logJ = np.log(np.linalg.det(F))
+        dim = F.shape[1]
+        I1 = np.einsum('tij,tij->t', F, F)
+        logJ = np.log(np.linalg.det(F)) if logJ is None else logJ
         W = 0.5 * self.mu * (I1 - dim - 2 * logJ) + 0.5 * self.lm * logJ ** 2
         return W
 
-    def stress_tensor(self, F: array) -> array:
+    def stress_tensor_batch(self, F: array, F_inv: array=None, logJ: array=None) -> array:
         '''
-        Compute the stress tensor P.
+        Compute the stress tensor P. `F_inv` and `logJ` optionally hold precomputed F^(-1) and
+        log(det(F)).
         Formula:
             P = mu * (F - F^(-T)) + lm * log(J) * F^(-T)
         '''
-        F_invT = np.linalg.inv(F).T
-        logJ = np.log(np.linalg.det(F))
+        F_invT = (np.linalg.inv(F) if F_inv is None else F_inv).transpose(0, 2, 1)
+        logJ = (np.log(np.linalg.det(F)) if logJ is None else logJ)[:, None, None]
         P = self.mu * (F - F_invT) + self.lm * logJ * F_invT
         return P
 
-    def stress_differential(self, F: array) -> array:
+    def stress_differential_batch(self, F: array, F_inv: array=None,
+                                  logJ: array=None) -> array:
         '''
         Compute the differential of the stress tensor P w.r.t. the deformation gradient F.
 
         Params:
-            * `F: array` - (dxd) the deformation gradient, d = #dimensions
+            * `F: array`     - (Txdxd) the deformation gradients, T = #elements, d = #dimensions
+            * `F_inv: array` - (Txdxd) optional, precomputed inverses of F
+            * `logJ: array`  - (T) optional, precomputed log(det(F))
 
         Return value:
-            * `dP_dF: array` - (d^2 x d^2) the gradient of the stress tensor P w.r.t. F
+            * `dP_dF: array` - (Txd^2xd^2) the gradients of the stress tensor P w.r.t. F
         '''
         # In this case, dP/dF is much more complicated
         #   - Compute D1 = mu * I
@@ -175,7 +261,7 @@ class NeoHookean(Material):
         #     where d(F^(-T))/dF = - F^(-T) * d(F^T)/dF * F^(-T)
 
         # Constants
-        dim, dim2 = F.shape[0], F.shape[0] ** 2
+        num_F, dim, dim2 = F.shape[0], F.shape[1], F.shape[1] ** 2
         mu, lm = self.mu, self.lm
 
         # Compute D1
@@ -183,8 +269,9 @@ class NeoHookean(Material):
 
         # Compute D2
         # F_invT flattened by columns is equivalent to F_inv flattened by rows
-        F_invT_vec = np.linalg.inv(F).ravel()
-        F_invT_outer = np.outer(F_invT_vec, F_invT_vec)
+        F_inv = np.linalg.inv(F) if F_inv is None else F_inv
+        F_invT_vec = F_inv.reshape(num_F, dim2)
+        F_invT_outer = F_invT_vec[:, :, None] * F_invT_vec[:, None, :]
         D2 = lm * F_invT_outer
 
         # Compute D3
@@ -192,11 +279,82 @@ class NeoHookean(Material):
         # Let (i, j) be the two dimensions of F_invT, and the same for (k, s). The axis order in
         # F_invT_outer is (j, i, s, k) since the matrix is flattened column by column.
         # However, the axis order of d(F^(-T))/dF is (s, i, j, k) according to the right hand side.
-        # Thus, the transpose is from (j, i, s, k) to (s, i, j, k), organized as (2, 1, 0, 3).
-        coeff = lm * np.log(np.linalg.det(F)) - mu
-        D3 = -coeff * F_invT_outer.reshape(dim, dim, dim, dim)
-        D3 = D3.transpose(2, 1, 0, 3).reshape(dim2, dim2)
+        # Thus, the transpose is from (j, i, s, k) to (s, i, j, k), organized as (2, 1, 0, 3)
+        # after the leading batch axis.
+        logJ = np.log(np.linalg.det(F)) if logJ is None else logJ
+        coeff = lm * logJ - mu
+        D3 = -coeff[:, None, None, None, None] * F_invT_outer.reshape(num_F, dim, dim, dim, dim)
+        D3 = D3.transpose(0, 3, 2, 1, 4).reshape(num_F, dim2, dim2)
 
         # Compute dP/dF
         dP_dF = D1 + D2 + D3
         return dP_dF
+
+    def evaluate_batch(self, F: array, differential: bool=False) -> Tuple[array, array, array]:
+        '''
+        Compute the energy densities, the stress tensors and optionally dP/dF in one pass, which
+        shares the inverses and determinants of F among the three quantities.
+        '''
+        F_inv = np.linalg.inv(F)
+        logJ = np.log(np.linalg.det(F))
+
+        W = self.energy_density_batch(F, logJ)
+        P = self.stress_tensor_batch(F, F_inv, logJ)
+        dP_dF = self.stress_differential_batch(F, F_inv, logJ) if differential else None
+        return W, P, dP_dF
+
+    def stress_differential_operator(self, F: array) -> Callable[[array], array]:
+        '''
+        Build the linear map dF -> dP at deformation gradients F.
+        Formula:
+            dP = mu * dF + lm * tr(F^(-1) * dF) * F^(-T)
+                 + (mu - lm * log(J)) * F^(-T) * dF^T * F^(-T)
+        '''
+        mu, lm = self.mu, self.lm
+
+        # Precompute the terms that only depend on F
+        F_inv = np.linalg.inv(F)
+        F_invT = F_inv.transpose(0, 2, 1)
+        coeff = (mu - lm * np.log(np.linalg.det(F)))[:, None, None]
+
+        def apply(dF: array) -> array:
+            F_inv_dF_trace = np.einsum('tij,tji->t', F_inv, dF)[:, None, None]
+            return mu * dF + lm * F_inv_dF_trace * F_invT \
+                + coeff * (F_invT @ dF.transpose(0, 2, 1) @ F_invT)
+
+        return apply
+
+
+def von_mises_stress(sigma: array) -> array:
+    '''
+    Compute the von Mises equivalent stresses of (Txdxd) Cauchy stress tensors. Returns a (T)
+    array.
+    Formula:
+        s = sigma - tr(sigma) / d * I
+        sigma_vm = sqrt(1.5 * s : s)
+    '''
+    dim = sigma.shape[1]
+    s = sigma - (np.trace(sigma, axis1=1, axis2=2) / dim)[:, None, None] * np.eye(dim)
+    return np.sqrt(1.5 * np.einsum('tij,tij->t', s, s))
+
+
+def green_lagrange_strain(F: array) -> array:
+    '''
+    Compute the Green-Lagrange strain tensors of (Txdxd) deformation gradients. Returns a
+    (Txdxd) array.
+    Formula:
+        E = 0.5 * (F^T * F - I)
+    '''
+    return 0.5 * (np.einsum('tki,tkj->tij', F, F) - np.eye(F.shape[1]))
+
+
+def equivalent_strain(E: array) -> array:
+    '''
+    Compute the von Mises equivalent strains of (Txdxd) strain tensors. Returns a (T) array.
+    Formula:
+        e = E - tr(E) / d * I
+        E_eq = sqrt(2 / 3 * e : e)
+    '''
+    dim = E.shape[1]
+    e = E - (np.trace(E, axis1=1, axis2=2) / dim)[:, None, None] * np.eye(dim)
+    return np.sqrt(2 / 3 * np.einsum('tij,tij->t', e, e))
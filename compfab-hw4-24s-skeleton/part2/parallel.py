@@ -0,0 +1,117 @@
+from numpy import ndarray as array
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+class SharedArrays:
+    '''
+    A set of named arrays in shared memory, which worker processes attach to by name without
+    copying. The arrays are freed by `close`.
+    '''
+    def __init__(self, arrays: Dict[str, array]):
+        '''
+        Copy the input arrays (`arrays`) into newly created shared memory blocks.
+        '''
+        self.blocks: Dict[str, SharedMemory] = {}
+        self.arrays: Dict[str, array] = {}
+
+        for name, value in arrays.items():
+            self.add(name, value)
+
+    def add(self, name: str, value: array):
+        '''
+        Add an array to shared memory under the given name.
+        '''
+        value = np.ascontiguousarray(value)
+        block = SharedMemory(create=True, size=max(value.nbytes, 1))
+        self.blocks[name] = block
+        self.arrays[name] = np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)
+        self.arrays[name][...] = value
+
+    def descriptors(self) -> Dict[str, Tuple[str, Tuple[int, ...], str]]:
+        '''
+        Get the (block name, shape, dtype) triplets that workers use to attach to the arrays.
+        '''
+        return {name: (self.blocks[name].name, value.shape, value.dtype.str)
+                for name, value in self.arrays.items()}
+
+    def __getitem__(self, name: str) -> array:
+        return self.arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+    def close(self):
+        '''
+        Release and free all shared memory blocks.
+        '''
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+# The shared arrays attached by the current worker process
+worker_blocks: List[SharedMemory] = []
+worker_arrays: Dict[str, array] = {}
+
+
+def init_worker(descriptors: Dict[str, Tuple[str, Tuple[int, ...], str]]):
+    '''
+    Attach a worker process to the shared arrays described by `descriptors`.
+    '''
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = SharedMemory(name=block_name)
+        worker_blocks.append(block)
+        worker_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def run_task(func: Callable, args: Tuple):
+    '''
+    Run a task in a worker process as `func(worker_arrays, *args)`.
+    '''
+    return func(worker_arrays, *args)
+
+
+class WorkerPool:
+    '''
+    A pool of worker processes that operate on a set of shared arrays. Tasks are module-level
+    functions which take the dictionary of shared arrays as their first argument, read their
+    inputs from it, and write their outputs into it.
+    '''
+    def __init__(self, arrays: SharedArrays, num_workers: int):
+        '''
+        Start `num_workers` worker processes attached to the shared arrays (`arrays`).
+        '''
+        self.arrays = arrays
+        self.num_workers = num_workers
+        self.pool = get_context().Pool(num_workers, initializer=init_worker,
+                                       initargs=(arrays.descriptors(),))
+
+    def map(self, func: Callable, tasks: List[Tuple]) -> List:
+        '''
+        Run `func(arrays, *args)` for every argument tuple in `tasks` across the workers, and
+        return the results in order.
+        '''
+        return self.pool.starmap(run_task, [(func, args) for args in tasks])
+
+    def close(self):
+        '''
+        Shut down the worker processes and free the shared arrays.
+        '''
+        self.pool.terminate()
+        self.pool.join()
+        self.arrays.close()
+
+
+def chunk_ranges(size: int, num_chunks: int) -> List[Tuple[int, int]]:
+    '''
+    Split the range [0, size) into `num_chunks` contiguous (start, end) ranges of nearly equal
+    lengths. Empty ranges are dropped.
+    '''
+    bounds = np.linspace(0, size, num_chunks + 1).astype(int)
+    return [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
@@ -0,0 +1,290 @@
+from voxelizer import Voxelizer
+from material import Material, LinearElastic, NeoHookean
+from tet_mesh import TetMesh, tet_mesh_cuboid
+from fem import StaticFEM
+from main import set_boundary_conditions, ROOT_DIR
+
+from typing import Callable, Dict, List, Tuple
+
+import io
+import os
+import sys
+import time
+import argparse
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+
+# Material parameters (same as the bridge designs)
+E, nu = 1e7, 0.45
+
+# Columns that identify a benchmark record across runs
+KEY_COLUMNS = ['case', 'material', 'operation']
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int, int]]:
+    '''
+    Parse a comma-separated list of cuboid sizes, e.g., '4x2x2,20x8x8'.
+    '''
+    return [tuple(int(c) for c in size.split('x')) for size in sizes.split(',') if size]
+
+
+def parse_floats(values: str) -> List[float]:
+    '''
+    Parse a comma-separated list of numbers, e.g., '0.5,0.25'.
+    '''
+    return [float(v) for v in values.split(',') if v]
+
+
+def bridge_mesh(stl_file: str, voxel_size: float) -> TetMesh:
+    '''
+    Voxelize a bridge design and convert the voxel grid into a tet mesh.
+    '''
+    voxelizer = Voxelizer(stl_file, voxel_size)
+    voxelizer.run_accelerated()
+    return voxelizer.convert_to_tet_mesh()
+
+
+def measure(func: Callable, repeats: int=1, setup: Callable=None,
+            trace: bool=True) -> Tuple[object, float, float]:
+    '''
+    Run `func()` `repeats` times and measure its best wall time. Tracing allocations slows down
+    allocation-heavy code, so the timed runs are not traced. If `trace` is True, `func()` runs
+    once more under tracemalloc, with its output suppressed, to measure its peak memory. The
+    optional `setup()` runs untimed before each call.
+
+    Return values:
+        * `result: object`      - return value of the last timed call
+        * `time: float`         - best wall time in seconds
+        * `peak_memory: float`  - peak memory allocated by the call in MB (traced by
+            tracemalloc, relative to the memory in use before the call), NaN if not traced
+    '''
+    best_time = np.inf
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start_time = time.perf_counter()
+        result = func()
+        best_time = min(best_time, time.perf_counter() - start_time)
+
+    # Measure the peak memory in a separate traced run
+    peak_memory = np.nan
+    if trace:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        base_memory = tracemalloc.get_traced_memory()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        peak_memory = (tracemalloc.get_traced_memory()[1] - base_memory) / 2 ** 20
+        tracemalloc.stop()
+
+    return result, best_time, peak_memory
+
+
+def benchmark_case(name: str, mesh: TetMesh, materials: Dict[str, Material], solver: str='cg',
+                   repeats: int=3, newton_iters: int=30, line_search: str='residual',
+                   trace_solves: bool=False) -> List[Dict]:
+    '''
+    Time the main stages of static FEM analysis on a tet mesh for each material: StaticFEM
+    construction (precomputation), stiffness matrix assembly, elastic forces, the linear solve
+    and the Newton solve. Boundary conditions follow the bridge designs, i.e., the top layer of
+    vertices is loaded and the left and right sides are fixed.
+
+    Cheap stages report the best of `repeats` runs, while the solves are timed once. The Newton
+    solve uses the `line_search` criterion and stops after `newton_iters` iterations. The peak
+    memory of every stage is measured in an extra traced run (see `measure`). For the solves,
+    which dominate the run time, this is opt-in (`trace_solves`) and their peak memory is NaN
+    otherwise.
+
+    Return value:
+        * `records: List[Dict]` - one record per material and stage
+    '''
+    f_ext, bc = set_boundary_conditions(mesh)
+    vertices = mesh.vertices
+
+    records = []
+    for material_name, material in materials.items():
+        # Time the construction of the FEM solver (precomputation)
+        fem, elapsed, peak_memory = measure(lambda: StaticFEM(mesh, material, solver=solver),
+                                            repeats)
+        stages = [('construction', 0, elapsed, peak_memory)]
+
+        for operation, func, num_repeats, trace in [
+            ('stiffness_matrix', lambda: fem.stiffness_matrix(vertices, bc), repeats, True),
+            ('elastic_force', lambda: fem.elastic_force(vertices), repeats, True),
+            ('solve_linear', lambda: fem.solve_linear(f_ext, bc, return_stats=True), 1,
+             trace_solves),
+            ('solve_newton', lambda: fem.solve_newton(f_ext, bc, max_iters=newton_iters,
+                                                      line_search=line_search,
+                                                      return_stats=True), 1, trace_solves),
+        ]:
+            # Drop the cached stiffness matrices so that every run does its full work
+            result, elapsed, peak_memory = measure(func, num_repeats,
+                                                   setup=fem.stiffness_cache.clear, trace=trace)
+
+            # Record the number of linear or Newton iterations of the solves
+            iterations = 0
+            if operation == 'solve_linear':
+                iterations = sum(stat['iterations'] for stat in result[1])
+            elif operation == 'solve_newton':
+                iterations = len(result[1])
+            stages.append((operation, iterations, elapsed, peak_memory))
+
+        fem.close()
+
+        for operation, iterations, elapsed, peak_memory in stages:
+            records.append({
+                'case': name,
+                'material': material_name,
+                'operation': operation,
+                'vertices': vertices.shape[0],
+                'elements': mesh.elements.shape[0],
+                'iterations': iterations,
+                'time': elapsed,
+                'peak_memory': peak_memory,
+            })
+            print(f'{name:>24} {material_name:>12} {operation:>16} {vertices.shape[0]:>8} '
+                  f'{mesh.elements.shape[0]:>8} {iterations:>6} {elapsed:>10.4f} '
+                  f'{peak_memory:>10.1f}')
+
+    return records
+
+
+def compare_to_baseline(results: pd.DataFrame, baseline: pd.DataFrame, tolerance: float=0.2,
+                        min_time: float=1e-2) -> pd.DataFrame:
+    '''
+    Compare benchmark results against a stored baseline. A record is flagged as a regression if
+    its time or peak memory exceeds the baseline by more than a relative `tolerance`. Times below
+    `min_time` seconds in both runs are considered noise and never flagged.
+
+    Return value:
+        * `comparison: DataFrame` - matched records with the baseline values, the time and
+            memory ratios (current / baseline) and a boolean `regression` column
+    '''
+    columns = KEY_COLUMNS + ['time', 'peak_memory']
+    comparison = results[columns].merge(baseline[columns], on=KEY_COLUMNS,
+                                        suffixes=('', '_baseline'))
+
+    # Compute ratios against the baseline
+    comparison['time_ratio'] = comparison['time'] / comparison['time_baseline']
+    comparison['memory_ratio'] = (comparison['peak_memory']
+                                  / np.maximum(comparison['peak_memory_baseline'], 1e-6))
+
+    # Flag regressions
+    slower = (comparison['time_ratio'] > 1 + tolerance) & \
+             (np.maximum(comparison['time'], comparison['time_baseline']) >= min_time)
+    heavier = (comparison['memory_ratio'] > 1 + tolerance) & \
+              (comparison['peak_memory'] - comparison['peak_memory_baseline'] >= 1.0)
+    comparison['regression'] = slower | heavier
+
+    return comparison
+
+
+def read_results(file_name: str) -> pd.DataFrame:
+    '''
+    Read benchmark results from a CSV or JSON file.
+    '''
+    if file_name.endswith('.json'):
+        return pd.read_json(file_name, orient='records')
+    return pd.read_csv(file_name)
+
+
+def write_results(results: pd.DataFrame, file_name: str):
+    '''
+    Write benchmark results to a CSV or JSON file, depending on the file extension.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(file_name)), mode=0o775, exist_ok=True)
+    if file_name.endswith('.json'):
+        results.to_json(file_name, orient='records', indent=2)
+    else:
+        results.to_csv(file_name, index=False)
+
+
+def main():
+    '''
+    Main routine.
+    '''
+    # Command line argument parser
+    parser = argparse.ArgumentParser(description='FEM scaling benchmark on cuboid and bridge '
+                                                 'meshes')
+    parser.add_argument('-c', '--cuboid-sizes', default='4x2x2,10x4x4,20x8x8,40x16x16,80x32x32',
+                        help='Comma-separated cuboid sizes in vertices (e.g. 4x2x2,20x8x8)')
+    parser.add_argument('-b', '--bridge', default='bridge_r_30_o_-25',
+                        help='Bridge design to voxelize (an STL file name in '
+                             'data/assignment5/bridges without extension), empty to skip')
+    parser.add_argument('-v', '--voxel-sizes', default='0.5,0.25',
+                        help='Comma-separated voxel sizes of the bridge design')
+    parser.add_argument('-s', '--solver', default='cg', help='Linear solver of StaticFEM')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='Number of runs of the construction, stiffness and force stages')
+    parser.add_argument('-n', '--newton-iters', type=int, default=30,
+                        help='Maximum number of Newton iterations, which keeps the workload of '
+                             'non-converging Neo-Hookean solves bounded')
+    parser.add_argument('-l', '--line-search', default='residual', choices=['residual', 'energy'],
+                        help="The acceptance criterion of the line search in Newton's method")
+    parser.add_argument('-m', '--trace-solves', action='store_true',
+                        help='Also measure the peak memory of the solves, which runs each solve '
+                             'a second time')
+    parser.add_argument('-o', '--output', default='',
+                        help='Save the results to a CSV or JSON file (by extension)')
+    parser.add_argument('--baseline', default='',
+                        help='Compare the results against a CSV or JSON baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown or memory growth flagged as a regression')
+
+    # Process arguments
+    args = parser.parse_args()
+    materials = {'linear': LinearElastic(E, nu), 'neohookean': NeoHookean(E, nu)}
+
+    # Collect the benchmark meshes. Cuboids use the finest voxel size as their cube size so that
+    # they are comparable with the bridge meshes.
+    voxel_sizes = parse_floats(args.voxel_sizes)
+    cube_size = min(voxel_sizes, default=0.25)
+    cases: List[Tuple[str, Callable[[], TetMesh]]] = []
+    for nx, ny, nz in parse_sizes(args.cuboid_sizes):
+        cases.append((f'cuboid_{nx}x{ny}x{nz}',
+                      lambda n=(nx, ny, nz): tet_mesh_cuboid(*n, cube_size)))
+    if args.bridge:
+        stl_file = os.path.join(ROOT_DIR, 'data', 'assignment5', 'bridges', f'{args.bridge}.stl')
+        for voxel_size in voxel_sizes:
+            cases.append((f'{args.bridge}_{voxel_size}',
+                          lambda v=voxel_size: bridge_mesh(stl_file, v)))
+
+    # Run the benchmark
+    print(f'{"case":>24} {"material":>12} {"operation":>16} {"#verts":>8} {"#tets":>8} '
+          f'{"iters":>6} {"time (s)":>10} {"peak (MB)":>10}')
+
+    records = []
+    for name, make_mesh in cases:
+        records += benchmark_case(name, make_mesh(), materials, solver=args.solver,
+                                  repeats=args.repeats, newton_iters=args.newton_iters,
+                                  line_search=args.line_search,
+                                  trace_solves=args.trace_solves)
+    results = pd.DataFrame(records)
+
+    # Optionally save the results, which can serve as the baseline of later runs
+    if args.output:
+        write_results(results, args.output)
+        print(f"Results saved to '{args.output}'")
+
+    # Optionally compare the results against a baseline and flag regressions
+    if args.baseline:
+        comparison = compare_to_baseline(results, read_results(args.baseline), args.tolerance)
+        print(f'\n{"case":>24} {"material":>12} {"operation":>16} {"time":>7} {"memory":>7}')
+        for row in comparison.itertuples():
+            flag = 'REGRESSION' if row.regression else ''
+            memory = f'{row.memory_ratio:>6.2f}x' if np.isfinite(row.memory_ratio) else f'{"-":>7}'
+            print(f'{row.case:>24} {row.material:>12} {row.operation:>16} '
+                  f'{row.time_ratio:>6.2f}x {memory} {flag}')
+
+        num_regressions = int(comparison['regression'].sum())
+        print(f'{num_regressions} regression(s) against {len(comparison)} baseline record(s)')
+        if num_regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()